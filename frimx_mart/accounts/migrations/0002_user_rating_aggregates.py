@@ -0,0 +1,67 @@
+# Generated by Django 5.2.10 on 2026-10-18 08:22
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_ratings(apps, schema_editor):
+    User = apps.get_model('accounts', 'User')
+    Review = apps.get_model('listings', 'Review')
+    totals = Review.objects.values('seller').annotate(
+        total=Sum('rating'),
+        count=Count('id'),
+        **{f'stars_{stars}': Count('id', filter=Q(rating=stars)) for stars in range(1, 6)}
+    ).order_by()
+    for row in totals:
+        User.objects.filter(pk=row['seller']).update(
+            rating_sum=row['total'],
+            rating_count=row['count'],
+            **{f'rating_{stars}_count': row[f'stars_{stars}'] for stars in range(1, 6)}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('listings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
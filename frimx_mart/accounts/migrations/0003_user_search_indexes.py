@@ -0,0 +1,43 @@
+# Generated by Django 5.2.10 on 2026-10-18 08:43
+
+from django.db import migrations, models
+
+
+def create_prefix_indexes(apps, schema_editor):
+    # Indexes matching the SQL Django generates for istartswith, so the
+    # manage users search does not scan the whole table
+    connection = schema_editor.connection
+    for column in ('username', 'email'):
+        if connection.vendor == 'sqlite':
+            # LIKE is case-insensitive and can use a NOCASE index
+            schema_editor.execute(
+                f"CREATE INDEX accounts_user_{column}_prefix ON accounts_user ({column} COLLATE NOCASE)"
+            )
+        elif connection.vendor == 'postgresql':
+            # UPPER(column::text) LIKE UPPER('term%')
+            schema_editor.execute(
+                f"CREATE INDEX accounts_user_{column}_prefix "
+                f"ON accounts_user (UPPER({column}::text) text_pattern_ops)"
+            )
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        for column in ('username', 'email'):
+            schema_editor.execute(f"DROP INDEX IF EXISTS accounts_user_{column}_prefix")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_user_rating_aggregates'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['date_joined', 'id'], name='user_date_joined_idx'),
+        ),
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
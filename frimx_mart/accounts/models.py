@@ -1,8 +1,13 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
-from django.db.models import Avg, Q
+from django.utils.functional import cached_property
 import uuid
 
+RATING_FIELDS = {
+    'rating_sum', 'rating_count',
+    'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+}
+
 class User(AbstractUser):
     profile_image = models.ImageField(upload_to='profile_images/', null=True, blank=True)
     location = models.CharField(max_length=200, blank=True, null=True)
@@ -17,32 +22,57 @@ class User(AbstractUser):
     total_listings = models.IntegerField(default=0)
     sold_listings = models.IntegerField(default=0)
     
+    # Seller rating aggregates, maintained from Review saves and deletes by
+    # listings.counters.adjust_seller_rating
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+    
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Keyset pagination on the manage users page. The case-insensitive
+            # prefix indexes its search uses are created in migration 0003
+            models.Index(fields=['date_joined', 'id'], name='user_date_joined_idx'),
+        ]
+    
     def __str__(self):
         return self.username
     
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # The rating aggregates are only changed through F() updates,
+            # never write back possibly stale values
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in RATING_FIELDS and f.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+    
     @property
     def average_rating(self):
-        from listings.models import Review
-        rating = Review.objects.filter(seller=self).aggregate(Avg('rating'))['rating__avg']
-        return rating if rating else 0
+        if not self.rating_count:
+            return 0
+        return self.rating_sum / self.rating_count
     
     @property
     def total_ratings(self):
-        from listings.models import Review
-        return Review.objects.filter(seller=self).count()
+        return self.rating_count
     
     @property
+    def rating_histogram(self):
+        """Number of reviews per star rating, as {1: n, ..., 5: n}"""
+        return {stars: getattr(self, f'rating_{stars}_count') for stars in range(1, 6)}
+    
+    @cached_property
     def unread_messages_count(self):
-        from chat.models import Message, ChatThread
-        # Count unread messages in threads where user is buyer or seller
-        threads = ChatThread.objects.filter(
-            Q(buyer=self) | Q(seller=self),
-            is_active=True
-        )
-        return Message.objects.filter(
-            thread__in=threads,
-            is_read=False
-        ).exclude(sender=self).count()
+        from chat.unread import get_unread_count
+        # Cached counter, rebuilt from the ChatThread unread counters on a miss
+        return get_unread_count(self.pk)
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
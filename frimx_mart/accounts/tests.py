@@ -1,3 +1,69 @@
 from django.test import TestCase
 
-# Create your tests here.
+from listings.models import Review
+from .models import User
+
+
+class SellerRatingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        cls.other_seller = User.objects.create_user('other', 'other@example.com', 'password')
+        cls.buyers = [
+            User.objects.create_user(f'buyer{i}', f'buyer{i}@example.com', 'password') for i in range(3)
+        ]
+
+    def review(self, buyer, rating, seller=None):
+        return Review.objects.create(
+            seller=seller or self.seller, buyer=buyer, rating=rating, comment='Comment'
+        )
+
+    def test_reviews_update_the_aggregates(self):
+        self.review(self.buyers[0], 5)
+        self.review(self.buyers[1], 4)
+        self.review(self.buyers[2], 4)
+
+        seller = User.objects.get(pk=self.seller.pk)
+        self.assertEqual(seller.total_ratings, 3)
+        self.assertAlmostEqual(seller.average_rating, 13 / 3)
+        self.assertEqual(seller.rating_histogram, {1: 0, 2: 0, 3: 0, 4: 2, 5: 1})
+
+    def test_changing_a_rating_moves_it_between_buckets(self):
+        review = self.review(self.buyers[0], 2)
+        review = Review.objects.get(pk=review.pk)
+        review.rating = 5
+        review.save()
+        # Saving again without a change must not count it twice
+        review.save()
+
+        seller = User.objects.get(pk=self.seller.pk)
+        self.assertEqual((seller.rating_count, seller.rating_sum), (1, 5))
+        self.assertEqual(seller.rating_histogram, {1: 0, 2: 0, 3: 0, 4: 0, 5: 1})
+
+    def test_moving_a_review_to_another_seller(self):
+        review = Review.objects.get(pk=self.review(self.buyers[0], 3).pk)
+        review.seller = self.other_seller
+        review.save()
+
+        seller = User.objects.get(pk=self.seller.pk)
+        other = User.objects.get(pk=self.other_seller.pk)
+        self.assertEqual((seller.rating_count, seller.rating_sum, seller.rating_3_count), (0, 0, 0))
+        self.assertEqual((other.rating_count, other.rating_sum, other.rating_3_count), (1, 3, 1))
+
+    def test_deleting_a_review_removes_it(self):
+        self.review(self.buyers[0], 5)
+        self.review(self.buyers[1], 1).delete()
+
+        seller = User.objects.get(pk=self.seller.pk)
+        self.assertEqual((seller.rating_count, seller.rating_sum), (1, 5))
+        self.assertEqual(seller.rating_1_count, 0)
+
+    def test_saving_a_stale_user_keeps_the_aggregates(self):
+        stale = User.objects.get(pk=self.seller.pk)
+        self.review(self.buyers[0], 4)
+
+        stale.location = 'Kumasi'
+        stale.save()
+
+        seller = User.objects.get(pk=self.seller.pk)
+        self.assertEqual((seller.location, seller.rating_count, seller.rating_sum), ('Kumasi', 1, 4))
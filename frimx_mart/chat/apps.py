@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ChatConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "chat"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from listings.storage import track_blob_field
+        from .models import Message
+        track_blob_field(Message, 'image')
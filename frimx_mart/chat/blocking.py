@@ -0,0 +1,63 @@
+"""
+Cached block lists for the chat entry points.
+
+The ids of everyone a user has blocked or been blocked by are cached under
+chat_blocks:<user_id>, so checking a send or a new chat is a cache read
+rather than a BlockedUser query. The BlockedUser signal handlers in
+chat/signals.py delete the keys of both users when a block is added or
+removed. That only reaches other processes through a shared cache, so with
+the default per-process one CHAT_BLOCK_CACHE_TIMEOUT is 0 and every check
+reads BlockedUser instead.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+BLOCK_CACHE_TIMEOUT = getattr(settings, 'CHAT_BLOCK_CACHE_TIMEOUT', 0)
+
+
+def block_cache_key(user_id):
+    return f'chat_blocks:{user_id}'
+
+
+def load_block_set(user_id):
+    from .models import BlockedUser
+
+    pairs = BlockedUser.objects.filter(
+        Q(blocker_id=user_id) | Q(blocked_id=user_id)
+    ).values_list('blocker_id', 'blocked_id')
+    return frozenset(
+        blocked_id if blocker_id == user_id else blocker_id
+        for blocker_id, blocked_id in pairs
+    )
+
+
+def get_block_set(user_id):
+    """Ids of the users user_id cannot chat with, in either direction."""
+    if BLOCK_CACHE_TIMEOUT <= 0:
+        return load_block_set(user_id)
+    key = block_cache_key(user_id)
+    blocks = cache.get(key)
+    if blocks is None:
+        blocks = load_block_set(user_id)
+        cache.set(key, blocks, BLOCK_CACHE_TIMEOUT)
+    return blocks
+
+
+async def aget_block_set(user_id):
+    from asgiref.sync import sync_to_async
+
+    blocks = None
+    if BLOCK_CACHE_TIMEOUT > 0:
+        blocks = await cache.aget(block_cache_key(user_id))
+    if blocks is None:
+        blocks = await sync_to_async(get_block_set)(user_id)
+    return blocks
+
+
+def is_blocked(user_id, other_id):
+    return other_id in get_block_set(user_id)
+
+
+def invalidate_blocks(*user_ids):
+    cache.delete_many([block_cache_key(user_id) for user_id in user_ids])
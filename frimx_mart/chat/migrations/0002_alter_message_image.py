@@ -0,0 +1,19 @@
+# Generated by Django 5.2.10 on 2026-10-18 08:28
+
+import listings.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=listings.storage.get_blob_storage, upload_to='chat_images/'),
+        ),
+    ]
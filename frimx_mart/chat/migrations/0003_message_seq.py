@@ -0,0 +1,42 @@
+from django.db import migrations, models
+
+
+def number_messages(apps, schema_editor):
+    ChatThread = apps.get_model('chat', 'ChatThread')
+    Message = apps.get_model('chat', 'Message')
+    for thread in ChatThread.objects.all().iterator():
+        messages = list(Message.objects.filter(thread=thread).order_by('sent_at', 'id'))
+        for seq, message in enumerate(messages, start=1):
+            message.seq = seq
+        Message.objects.bulk_update(messages, ['seq'], batch_size=1000)
+        ChatThread.objects.filter(pk=thread.pk).update(last_seq=len(messages))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_alter_message_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatthread',
+            name='last_seq',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='seq',
+            field=models.PositiveIntegerField(default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.RunPython(number_messages, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='message',
+            options={'ordering': ['seq']},
+        ),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(fields=('thread', 'seq'), name='message_thread_seq_uniq'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.10 on 2026-10-18 08:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_inbox(apps, schema_editor):
+    ChatThread = apps.get_model('chat', 'ChatThread')
+    Message = apps.get_model('chat', 'Message')
+    threads = ChatThread.objects.annotate(
+        buyer_unread=Count('messages', filter=Q(messages__is_read=False) & ~Q(messages__sender=models.F('buyer'))),
+        seller_unread=Count('messages', filter=Q(messages__is_read=False) & ~Q(messages__sender=models.F('seller'))),
+    )
+    for thread in threads.iterator():
+        last = Message.objects.filter(thread=thread).order_by('-seq').first()
+        if last is not None:
+            thread.last_message_text = last.content[:200]
+            thread.last_message_has_image = bool(last.image)
+            thread.last_message_sender_id = last.sender_id
+            thread.last_message_at = last.sent_at
+        thread.buyer_unread_count = thread.buyer_unread
+        thread.seller_unread_count = thread.seller_unread
+        thread.save(update_fields=[
+            'last_message_text', 'last_message_has_image', 'last_message_sender',
+            'last_message_at', 'buyer_unread_count', 'seller_unread_count',
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_message_seq'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatthread',
+            name='buyer_unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatthread',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatthread',
+            name='last_message_has_image',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='chatthread',
+            name='last_message_sender',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='chatthread',
+            name='last_message_text',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='chatthread',
+            name='seller_unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_inbox, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def backfill_watermarks(apps, schema_editor):
+    ChatThread = apps.get_model('chat', 'ChatThread')
+    Message = apps.get_model('chat', 'Message')
+    for thread in ChatThread.objects.all().iterator():
+        read = Message.objects.filter(thread=thread, is_read=True)
+        # A participant has read up to the newest read message sent to them
+        thread.buyer_last_read_seq = read.filter(sender=thread.seller_id).aggregate(
+            seq=Max('seq'))['seq'] or 0
+        thread.seller_last_read_seq = read.filter(sender=thread.buyer_id).aggregate(
+            seq=Max('seq'))['seq'] or 0
+        thread.save(update_fields=['buyer_last_read_seq', 'seller_last_read_seq'])
+
+
+def restore_is_read(apps, schema_editor):
+    ChatThread = apps.get_model('chat', 'ChatThread')
+    Message = apps.get_model('chat', 'Message')
+    for thread in ChatThread.objects.all().iterator():
+        Message.objects.filter(
+            thread=thread, sender=thread.seller_id, seq__lte=thread.buyer_last_read_seq
+        ).update(is_read=True)
+        Message.objects.filter(
+            thread=thread, sender=thread.buyer_id, seq__lte=thread.seller_last_read_seq
+        ).update(is_read=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_thread_inbox_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatthread',
+            name='buyer_last_read_seq',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatthread',
+            name='seller_last_read_seq',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_watermarks, restore_is_read),
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+    ]
@@ -1,8 +1,13 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 import uuid
 
+from listings.storage import get_blob_storage
+from .unread import adjust_unread_count
+
 User = get_user_model()
 
 class ChatThread(models.Model):
@@ -13,6 +18,22 @@ class ChatThread(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    # seq of the newest message, the counter Message.seq is allocated from
+    last_seq = models.PositiveIntegerField(default=0)
+    # Snapshot of the newest message and unread counters for the inbox,
+    # written by Message.save() in the same UPDATE that allocates its seq
+    last_message_text = models.CharField(max_length=200, blank=True)
+    last_message_has_image = models.BooleanField(default=False)
+    last_message_sender = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    buyer_unread_count = models.PositiveIntegerField(default=0)
+    seller_unread_count = models.PositiveIntegerField(default=0)
+    # Read watermarks: every message up to this seq has been read by the
+    # participant. Read receipts are derived from them
+    buyer_last_read_seq = models.PositiveIntegerField(default=0)
+    seller_last_read_seq = models.PositiveIntegerField(default=0)
     
     class Meta:
         unique_together = ['listing', 'buyer', 'seller']
@@ -21,37 +42,126 @@ class ChatThread(models.Model):
     def __str__(self):
         return f"Chat: {self.buyer} - {self.seller}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the dashboard stats tell when is_active changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
+    # Counters only ever change through F() updates, never write back a
+    # possibly stale copy
+    COUNTER_FIELDS = {
+        'last_seq', 'last_message_text', 'last_message_has_image', 'last_message_sender',
+        'last_message_at', 'buyer_unread_count', 'seller_unread_count',
+        'buyer_last_read_seq', 'seller_last_read_seq',
+    }
+    
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+    
     @property
     def last_message(self):
-        return self.messages.order_by('-sent_at').first()
+        return self.messages.order_by('-seq').first()
+    
+    def other_participant_id(self, user):
+        return self.seller_id if user.pk == self.buyer_id else self.buyer_id
+    
+    def unread_field(self, user):
+        """Name of the unread counter of the given participant"""
+        return 'buyer_unread_count' if user.pk == self.buyer_id else 'seller_unread_count'
     
     def unread_count(self, user):
         """Return count of unread messages for the given user"""
-        return self.messages.filter(is_read=False).exclude(sender=user).count()
+        return getattr(self, self.unread_field(user))
     
     def has_unread(self, user):
         """Check if there are unread messages for the given user"""
-        return self.messages.filter(is_read=False).exclude(sender=user).exists()
+        return self.unread_count(user) > 0
+    
+    def last_read_seq(self, user):
+        """Read watermark of the given participant"""
+        return self.buyer_last_read_seq if user.pk == self.buyer_id else self.seller_last_read_seq
+    
+    def mark_read(self, user):
+        """
+        Mark everything up to last_seq as read by the given participant with a
+        single-row UPDATE of its watermark and unread counter.
+        """
+        prefix = 'buyer' if user.pk == self.buyer_id else 'seller'
+        watermark, unread = f'{prefix}_last_read_seq', f'{prefix}_unread_count'
+        count = getattr(self, unread)
+        if not count and getattr(self, watermark) >= self.last_seq:
+            return
+        # Messages that arrived after this thread was loaded stay unread
+        ChatThread.objects.filter(pk=self.pk).update(**{
+            watermark: Greatest(F(watermark), self.last_seq),
+            unread: Greatest(F(unread) - count, 0),
+        })
+        setattr(self, watermark, max(getattr(self, watermark), self.last_seq))
+        setattr(self, unread, 0)
+        if count:
+            transaction.on_commit(lambda: adjust_unread_count(user.pk, -count))
 
 class Message(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     thread = models.ForeignKey(ChatThread, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.TextField()
-    image = models.ImageField(upload_to='chat_images/', null=True, blank=True)
-    is_read = models.BooleanField(default=False)
+    image = models.ImageField(upload_to='chat_images/', storage=get_blob_storage, null=True, blank=True)
     sent_at = models.DateTimeField(auto_now_add=True)
+    # 1, 2, 3... within the thread, clients sync and page with it
+    seq = models.PositiveIntegerField(editable=False)
     
     class Meta:
-        ordering = ['sent_at']
+        ordering = ['seq']
+        constraints = [
+            models.UniqueConstraint(fields=['thread', 'seq'], name='message_thread_seq_uniq'),
+        ]
     
     def __str__(self):
         return f"Message from {self.sender}"
     
-    def mark_as_read(self):
-        if not self.is_read:
-            self.is_read = True
-            self.save()
+    def save(self, *args, **kwargs):
+        if self.seq is None:
+            thread = self.thread
+            if self.sender_id == thread.buyer_id:
+                recipient_id, recipient_unread = thread.seller_id, 'seller_unread_count'
+            else:
+                recipient_id, recipient_unread = thread.buyer_id, 'buyer_unread_count'
+            now = timezone.now()
+            with transaction.atomic():
+                # The UPDATE locks the thread row until the message is
+                # inserted, so concurrent senders get consecutive numbers
+                ChatThread.objects.filter(pk=self.thread_id).update(
+                    last_seq=F('last_seq') + 1,
+                    last_message_text=self.content[:200],
+                    last_message_has_image=bool(self.image),
+                    last_message_sender=self.sender_id,
+                    last_message_at=now,
+                    updated_at=now,
+                    **{recipient_unread: F(recipient_unread) + 1}
+                )
+                self.seq = ChatThread.objects.filter(pk=self.thread_id).values_list(
+                    'last_seq', flat=True
+                ).get()
+                super().save(*args, **kwargs)
+                transaction.on_commit(lambda: adjust_unread_count(recipient_id, 1))
+        else:
+            super().save(*args, **kwargs)
+    
+    @property
+    def is_read(self):
+        """Whether the recipient's read watermark has passed this message"""
+        thread = self.thread
+        if self.sender_id == thread.buyer_id:
+            return self.seq <= thread.seller_last_read_seq
+        return self.seq <= thread.buyer_last_read_seq
 
 class BlockedUser(models.Model):
     blocker = models.ForeignKey(User, on_delete=models.CASCADE, related_name='blocked_users')
@@ -0,0 +1,98 @@
+"""
+In-process publish/subscribe for pushing chat messages to open tabs.
+
+send_message publishes every new message on the channel of its thread, and
+the streaming views in chat/views.py subscribe to it. Subscribers are
+asyncio queues living on the event loop of the request that created them,
+publishers may run in any thread.
+
+There is no broker: only subscribers in the same process are notified. The
+stream and long-poll views always catch up from the database as well, so a
+message published by another process is delivered late, never lost.
+"""
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# A subscriber this far behind is dropped and has to reconnect and catch up
+# from the database
+MAX_PENDING_EVENTS = 100
+
+
+def thread_channel(thread_id):
+    return f'thread:{thread_id}'
+
+
+class Subscription:
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=MAX_PENDING_EVENTS)
+        self.overflowed = False
+
+    def _deliver(self, event):
+        # Runs on self.loop
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout=None):
+        """Return the next event, or None after timeout seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Broker:
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        """Subscribe the running event loop to channel."""
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+    def publish(self, channel, event):
+        """Send event to every subscriber of channel, return how many there were."""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, event)
+            except RuntimeError:
+                # The subscriber's event loop has been closed
+                self.unsubscribe(subscription)
+        return len(subscriptions)
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._subscriptions.get(channel, ()))
+
+
+broker = Broker()
@@ -0,0 +1,34 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from listings.activity import record_activity
+from .blocking import invalidate_blocks
+from .models import BlockedUser, ChatThread
+from .unread import reset_unread_count
+
+
+@receiver(post_save, sender=ChatThread)
+def thread_saved(sender, instance, created, raw=False, **kwargs):
+    # A chat started about a listing counts towards its seller's stats
+    if created and not raw and instance.listing_id:
+        record_activity(instance.listing_id, 'chat_starts')
+
+
+@receiver(post_delete, sender=ChatThread)
+def thread_deleted(sender, instance, **kwargs):
+    if instance.listing_id:
+        record_activity(
+            instance.listing_id, 'chat_starts', -1, timezone.localdate(instance.created_at)
+        )
+    # Its unread messages no longer count towards either badge
+    if instance.buyer_unread_count:
+        reset_unread_count(instance.buyer_id)
+    if instance.seller_unread_count:
+        reset_unread_count(instance.seller_id)
+
+
+@receiver(post_save, sender=BlockedUser)
+@receiver(post_delete, sender=BlockedUser)
+def block_changed(sender, instance, **kwargs):
+    invalidate_blocks(instance.blocker_id, instance.blocked_id)
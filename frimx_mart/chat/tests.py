@@ -1,3 +1,162 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from listings.testing import make_listing
+from .models import BlockedUser, ChatThread, Message
+from .unread import get_unread_count
+
+User = get_user_model()
+
+
+class ChatTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+
+    def setUp(self):
+        self.thread = ChatThread.objects.create(buyer=self.buyer, seller=self.seller)
+
+    def send(self, sender, content='Hello', thread=None):
+        return Message.objects.create(thread=thread or self.thread, sender=sender, content=content)
+
+    def reload(self, thread=None):
+        return ChatThread.objects.get(pk=(thread or self.thread).pk)
+
+
+class MessageSequenceTests(ChatTestCase):
+    def test_messages_are_numbered_from_one_per_thread(self):
+        other_buyer = User.objects.create_user('other', 'other@example.com', 'password')
+        other = ChatThread.objects.create(buyer=other_buyer, seller=self.seller)
+
+        first = [self.send(self.buyer), self.send(self.seller), self.send(self.buyer)]
+        second = [self.send(other_buyer, thread=other), self.send(self.seller, thread=other)]
+
+        self.assertEqual([message.seq for message in first], [1, 2, 3])
+        self.assertEqual([message.seq for message in second], [1, 2])
+        self.assertEqual(self.reload().last_seq, 3)
+        self.assertEqual(self.reload(other).last_seq, 2)
+
+    def test_thread_keeps_a_snapshot_of_the_newest_message(self):
+        self.send(self.buyer, 'Is it still available?')
+        self.send(self.seller, 'Yes it is')
+
+        thread = self.reload()
+        self.assertEqual(thread.last_message_text, 'Yes it is')
+        self.assertEqual(thread.last_message_sender_id, self.seller.pk)
+        self.assertEqual(thread.last_message.seq, 2)
+
+    def test_saving_a_stale_thread_keeps_its_counters(self):
+        stale = self.reload()
+        self.send(self.buyer)
+
+        stale.is_active = False
+        stale.save()
+
+        thread = self.reload()
+        self.assertFalse(thread.is_active)
+        self.assertEqual((thread.last_seq, thread.seller_unread_count), (1, 1))
+        self.assertEqual(self.send(self.seller).seq, 2)
+
+
+class ReadWatermarkTests(ChatTestCase):
+    def test_messages_count_as_unread_for_the_recipient_only(self):
+        self.send(self.buyer)
+        self.send(self.buyer)
+
+        thread = self.reload()
+        self.assertEqual(thread.unread_count(self.seller), 2)
+        self.assertEqual(thread.unread_count(self.buyer), 0)
+        self.assertEqual(get_unread_count(self.seller.pk), 2)
+        self.assertEqual(get_unread_count(self.buyer.pk), 0)
+
+    def test_mark_read_moves_the_watermark_past_every_message(self):
+        first = self.send(self.buyer)
+        second = self.send(self.buyer)
+        self.assertFalse(Message.objects.get(pk=first.pk).is_read)
+
+        self.reload().mark_read(self.seller)
+
+        thread = self.reload()
+        self.assertEqual(thread.last_read_seq(self.seller), 2)
+        self.assertEqual(thread.unread_count(self.seller), 0)
+        self.assertEqual(get_unread_count(self.seller.pk), 0)
+        self.assertTrue(Message.objects.get(pk=first.pk).is_read)
+        self.assertTrue(Message.objects.get(pk=second.pk).is_read)
+
+    def test_messages_after_the_thread_was_loaded_stay_unread(self):
+        self.send(self.buyer)
+        stale = self.reload()
+        late = self.send(self.buyer)
+
+        stale.mark_read(self.seller)
+
+        thread = self.reload()
+        self.assertEqual(thread.last_read_seq(self.seller), 1)
+        self.assertEqual(thread.unread_count(self.seller), 1)
+        self.assertFalse(Message.objects.get(pk=late.pk).is_read)
+
+    def test_watermark_never_moves_backwards(self):
+        self.send(self.buyer)
+        stale = self.reload()
+        self.send(self.buyer)
+        self.reload().mark_read(self.seller)
+
+        stale.mark_read(self.seller)
+
+        thread = self.reload()
+        self.assertEqual(thread.last_read_seq(self.seller), 2)
+        self.assertEqual(thread.unread_count(self.seller), 0)
+
+
+class BlockingTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.send(self.seller, 'Still available')
+        self.client.force_login(self.buyer)
+
+    def block(self, blocker, blocked):
+        return BlockedUser.objects.create(blocker=blocker, blocked=blocked)
+
+    def post_message(self):
+        return self.client.post(
+            f'/chat/{self.thread.id}/send/', {'content': 'Hello'}, content_type='application/json'
+        )
+
+    def assert_all_refused(self):
+        self.assertEqual(self.post_message().status_code, 403)
+        for endpoint in ['get', 'poll', 'stream']:
+            with self.subTest(endpoint=endpoint):
+                response = self.client.get(f'/chat/{self.thread.id}/{endpoint}/?after=0')
+                self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.reload().last_seq, 1)
+
+    def test_blocked_user_is_refused_everywhere(self):
+        self.block(self.seller, self.buyer)
+        self.assert_all_refused()
+
+    def test_blocking_someone_also_stops_your_own_messages(self):
+        self.block(self.buyer, self.seller)
+        self.assert_all_refused()
+
+    def test_blocked_user_cannot_start_a_thread(self):
+        listing = make_listing(self.seller)
+        self.block(self.seller, self.buyer)
+
+        response = self.client.get(f'/chat/start/{listing.id}/')
+
+        self.assertRedirects(response, f'/listings/{listing.id}/', fetch_redirect_response=False)
+        self.assertFalse(ChatThread.objects.filter(listing=listing).exists())
+
+    def test_unblocking_takes_effect_through_the_cache(self):
+        self.addCleanup(cache.clear)
+        with mock.patch('chat.blocking.BLOCK_CACHE_TIMEOUT', 3600):
+            self.assertEqual(self.post_message().status_code, 200)
+            block = self.block(self.seller, self.buyer)
+            self.assertEqual(self.post_message().status_code, 403)
+
+            block.delete()
+            self.assertEqual(self.post_message().status_code, 200)
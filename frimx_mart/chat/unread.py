@@ -0,0 +1,65 @@
+"""
+Per-user unread message badge.
+
+The total number of unread messages of a user is kept in the cache under
+chat_unread:<user_id>. Message.save() increments the recipient's counter,
+ChatThread.mark_read() decrements the reader's, and a missing or evicted key
+is rebuilt from the per-thread unread counters on ChatThread, so rendering
+the badge never reads the Message table. Changes made by one process only
+reach the others through a shared cache, so with the default per-process one
+CHAT_UNREAD_CACHE_TIMEOUT is 0 and the badge is summed from ChatThread on
+every read.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, IntegerField, Q, Sum, When
+
+UNREAD_CACHE_TIMEOUT = getattr(settings, 'CHAT_UNREAD_CACHE_TIMEOUT', 0)
+
+
+def unread_cache_key(user_id):
+    return f'chat_unread:{user_id}'
+
+
+def count_unread(user_id):
+    """Sum the reader's unread counters over their active threads."""
+    from .models import ChatThread
+
+    total = ChatThread.objects.filter(
+        Q(buyer_id=user_id) | Q(seller_id=user_id),
+        is_active=True
+    ).aggregate(total=Sum(Case(
+        When(buyer_id=user_id, then='buyer_unread_count'),
+        default='seller_unread_count',
+        output_field=IntegerField(),
+    )))['total']
+    return total or 0
+
+
+def get_unread_count(user_id):
+    if UNREAD_CACHE_TIMEOUT <= 0:
+        return count_unread(user_id)
+    key = unread_cache_key(user_id)
+    count = cache.get(key)
+    if count is None:
+        count = count_unread(user_id)
+        cache.set(key, count, UNREAD_CACHE_TIMEOUT)
+    return count
+
+
+def adjust_unread_count(user_id, delta):
+    """Add delta to a cached counter, a missing one is rebuilt on next read."""
+    if not delta or UNREAD_CACHE_TIMEOUT <= 0:
+        return
+    key = unread_cache_key(user_id)
+    try:
+        count = cache.incr(key, delta)
+    except ValueError:
+        return
+    if count < 0:
+        # Drifted, let the next read rebuild it
+        cache.delete(key)
+
+
+def reset_unread_count(user_id):
+    cache.delete(unread_cache_key(user_id))
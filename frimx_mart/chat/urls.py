@@ -7,5 +7,10 @@ urlpatterns = [
     path('start/<uuid:listing_id>/', views.start_chat, name='start_chat'),
     path('<uuid:thread_id>/send/', views.send_message, name='send_message'),
     path('<uuid:thread_id>/get/', views.get_messages, name='get_messages'),
+    path('<uuid:thread_id>/stream/', views.message_stream, name='message_stream'),
+    path('<uuid:thread_id>/poll/', views.poll_messages, name='poll_messages'),
+    path('<uuid:thread_id>/read/', views.mark_read, name='mark_chat_read'),
     path('block/<int:user_id>/', views.block_user, name='block_user'),
+    path('unblock/<int:user_id>/', views.unblock_user, name='unblock_user'),
+    path('unread/', views.unread_count, name='chat_unread_count'),
 ]
\ No newline at end of file
@@ -2,22 +2,30 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user_model
 from django.contrib import messages
-from django.http import JsonResponse
+from django.core.exceptions import PermissionDenied
+from django.conf import settings
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.db import transaction
 from django.db.models import Q
 from .models import ChatThread, Message, BlockedUser
+from .pubsub import broker, thread_channel
+from .unread import get_unread_count
+from .blocking import aget_block_set, is_blocked
 from listings.models import Listing
+import asyncio
 import json
 
 User = get_user_model()
 
 @login_required
 def chat_list(request):
-    # Get all chats where user is buyer or seller
+    # Get all chats where user is buyer or seller. The last message and
+    # unread counters are stored on the thread, so this is a single query
     chats = ChatThread.objects.filter(
         Q(buyer=request.user) | Q(seller=request.user),
         is_active=True
-    ).select_related('listing', 'buyer', 'seller').prefetch_related('messages')
+    ).select_related('listing', 'buyer', 'seller')
     
     # Add unread status to each chat
     chats_with_unread = []
@@ -30,25 +38,47 @@ def chat_list(request):
     }
     return render(request, 'chat/chat_list.html', context)
 
+def _parse_seq(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def history_page(thread, before=None):
+    """
+    The MESSAGES_PER_PAGE messages before seq before (the latest ones when
+    before is None) oldest first, and whether there are older ones.
+    """
+    per_page = settings.MESSAGES_PER_PAGE
+    messages = thread.messages.select_related('sender')
+    if before is not None:
+        messages = messages.filter(seq__lt=before)
+    page = list(messages.order_by('-seq')[:per_page + 1])
+    return page[:per_page][::-1], len(page) > per_page
+
 @login_required
 def chat_detail(request, thread_id):
     thread = get_object_or_404(
         ChatThread.objects.filter(
             Q(buyer=request.user) | Q(seller=request.user),
             id=thread_id
-        )
+        ).select_related('listing', 'buyer', 'seller')
     )
     
     # Mark messages as read
-    thread.messages.filter(is_read=False).exclude(sender=request.user).update(is_read=True)
+    thread.mark_read(request.user)
     
-    # Get chat messages
-    messages = thread.messages.all().order_by('sent_at')
+    # Only the latest page, older ones are fetched from get_messages with
+    # ?before= when the user scrolls up
+    messages, has_older = history_page(thread)
     
     context = {
         'thread': thread,
         'messages': messages,
+        'has_older': has_older,
+        'blocked': is_blocked(request.user.pk, thread.other_participant_id(request.user)),
         'other_user': thread.seller if request.user == thread.buyer else thread.buyer,
+        'chat_push': settings.CHAT_PUSH,
     }
     return render(request, 'chat/chat_detail.html', context)
 
@@ -60,6 +90,10 @@ def start_chat(request, listing_id):
         messages.error(request, "You cannot chat with yourself!")
         return redirect('listing_detail', listing_id=listing_id)
     
+    if is_blocked(request.user.pk, listing.seller_id):
+        messages.error(request, "You cannot chat with this user.")
+        return redirect('listing_detail', listing_id=listing_id)
+    
     # Check if chat already exists
     thread, created = ChatThread.objects.get_or_create(
         listing=listing,
@@ -73,6 +107,17 @@ def start_chat(request, listing_id):
     
     return redirect('chat_detail', thread_id=thread.id)
 
+def serialize_message(msg):
+    return {
+        'id': str(msg.id),
+        'sender': msg.sender.username,
+        'content': msg.content,
+        'image_url': msg.image.url if msg.image else None,
+        'is_read': msg.is_read,
+        'sent_at': msg.sent_at.isoformat(),
+        'seq': msg.seq,
+    }
+
 @login_required
 @csrf_exempt
 def send_message(request, thread_id):
@@ -84,7 +129,14 @@ def send_message(request, thread_id):
             )
         )
         
-        data = json.loads(request.body)
+        if is_blocked(request.user.pk, thread.other_participant_id(request.user)):
+            return JsonResponse({'success': False, 'error': 'You cannot message this user'}, status=403)
+        
+        # JSON for text messages, multipart when an image is attached
+        if request.content_type == 'application/json':
+            data = json.loads(request.body)
+        else:
+            data = request.POST
         content = data.get('content', '').strip()
         image = request.FILES.get('image')
         
@@ -96,24 +148,51 @@ def send_message(request, thread_id):
                 image=image
             )
             
-            # Update thread's updated_at
-            thread.save()
+            # Message.save() has updated the thread's updated_at, last message
+            # snapshot and unread counter
+            
+            message_data = serialize_message(message)
+            # Push to the open tabs of both participants
+            transaction.on_commit(
+                lambda: broker.publish(thread_channel(thread.id), message_data)
+            )
             
             return JsonResponse({
                 'success': True,
-                'message_id': str(message.id),
+                'message_id': message_data['id'],
                 'content': message.content,
-                'image_url': message.image.url if message.image else None,
+                'image_url': message_data['image_url'],
                 'sender': message.sender.username,
-                'sent_at': message.sent_at.isoformat(),
+                'sent_at': message_data['sent_at'],
+                'message': message_data,
             })
         
         return JsonResponse({'success': False, 'error': 'Empty message'})
     
     return JsonResponse({'success': False, 'error': 'Invalid method'})
 
+@login_required
+def mark_read(request, thread_id):
+    """Called by an open chat page when it shows newly pushed messages"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid method'})
+    thread = get_object_or_404(
+        ChatThread.objects.filter(
+            Q(buyer=request.user) | Q(seller=request.user),
+            id=thread_id
+        )
+    )
+    thread.mark_read(request.user)
+    return JsonResponse({'success': True, 'last_read_seq': thread.last_read_seq(request.user)})
+
 @login_required
 def get_messages(request, thread_id):
+    """
+    Messages of a thread, oldest first. ?after=<seq> returns the messages sent
+    since the client last synced, ?before=<seq> the page of older history
+    before it, and no parameter the latest page. has_more tells whether
+    another request in the same direction would return more.
+    """
     thread = get_object_or_404(
         ChatThread.objects.filter(
             Q(buyer=request.user) | Q(seller=request.user),
@@ -121,26 +200,106 @@ def get_messages(request, thread_id):
         )
     )
     
-    last_message_id = request.GET.get('last_message_id')
+    if is_blocked(request.user.pk, thread.other_participant_id(request.user)):
+        return JsonResponse({'error': 'You cannot message this user'}, status=403)
+    
+    after = _parse_seq(request.GET.get('after'))
     
-    if last_message_id:
-        messages = thread.messages.filter(id__gt=last_message_id)
+    if after is not None:
+        per_page = settings.MESSAGES_PER_PAGE
+        page = list(
+            thread.messages.select_related('sender').filter(seq__gt=after).order_by('seq')[:per_page + 1]
+        )
+        has_more = len(page) > per_page
+        page = page[:per_page]
     else:
-        messages = thread.messages.all().order_by('-sent_at')[:50]
-    
-    messages_data = []
-    for msg in messages:
-        messages_data.append({
-            'id': str(msg.id),
-            'sender': msg.sender.username,
-            'content': msg.content,
-            'image_url': msg.image.url if msg.image else None,
-            'is_read': msg.is_read,
-            'sent_at': msg.sent_at.isoformat(),
-        })
+        page, has_more = history_page(thread, _parse_seq(request.GET.get('before')))
+    
+    return JsonResponse({
+        'messages': [serialize_message(msg) for msg in page],
+        'has_more': has_more,
+        'last_seq': thread.last_seq,
+    })
+
+async def _participant_thread(request, thread_id):
+    user = await request.auser()
+    thread = await ChatThread.objects.filter(
+        Q(buyer=user) | Q(seller=user),
+        id=thread_id
+    ).afirst()
+    if thread is None:
+        raise Http404('No ChatThread matches the given query.')
+    if thread.other_participant_id(user) in await aget_block_set(user.pk):
+        raise PermissionDenied
+    return thread
+
+async def _messages_after(thread, after):
+    """Messages of thread with seq greater than after, oldest first."""
+    messages = thread.messages.filter(seq__gt=after).select_related('sender').order_by('seq')
+    return [serialize_message(msg) async for msg in messages]
+
+def _sse_event(message_data):
+    return f"id: {message_data['seq']}\nevent: message\ndata: {json.dumps(message_data)}\n\n"
+
+@login_required
+async def message_stream(request, thread_id):
+    """
+    Server-Sent Events stream of new messages in a thread. The stream ends
+    after CHAT_STREAM_MAX_SECONDS and the browser reconnects with
+    Last-Event-ID, which is also how messages missed in between are replayed.
+    """
+    thread = await _participant_thread(request, thread_id)
+    after = _parse_seq(request.headers.get('Last-Event-ID') or request.GET.get('after'))
+    if after is None:
+        after = thread.last_seq
+    loop = asyncio.get_running_loop()
     
+    async def events():
+        with broker.subscribe(thread_channel(thread.id)) as subscription:
+            yield f'retry: {settings.CHAT_STREAM_RETRY_MS}\n\n'
+            # Subscribed before catching up, so nothing falls in between
+            last_seq = after
+            for message_data in await _messages_after(thread, after):
+                last_seq = message_data['seq']
+                yield _sse_event(message_data)
+            deadline = loop.time() + settings.CHAT_STREAM_MAX_SECONDS
+            while loop.time() < deadline and not subscription.overflowed:
+                message_data = await subscription.get(timeout=settings.CHAT_STREAM_HEARTBEAT)
+                if message_data is None:
+                    # Keeps proxies from closing an idle connection
+                    yield ': keepalive\n\n'
+                elif message_data['seq'] > last_seq:
+                    last_seq = message_data['seq']
+                    yield _sse_event(message_data)
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@login_required
+async def poll_messages(request, thread_id):
+    """
+    Long-polling fallback for message_stream: returns messages after
+    ?after=<seq> right away, or waits up to CHAT_LONG_POLL_TIMEOUT seconds
+    for one. Under WSGI the wait holds a worker thread the whole time.
+    """
+    thread = await _participant_thread(request, thread_id)
+    after = _parse_seq(request.GET.get('after'))
+    if after is None:
+        after = thread.last_seq
+    with broker.subscribe(thread_channel(thread.id)) as subscription:
+        messages_data = await _messages_after(thread, after)
+        if not messages_data:
+            await subscription.get(timeout=settings.CHAT_LONG_POLL_TIMEOUT)
+            messages_data = await _messages_after(thread, after)
     return JsonResponse({'messages': messages_data})
 
+@login_required
+def unread_count(request):
+    """Unread message badge, for refreshing it without reloading the page"""
+    return JsonResponse({'unread': get_unread_count(request.user.pk)})
+
 @login_required
 def block_user(request, user_id):
     user_to_block = get_object_or_404(User, id=user_id)
@@ -157,6 +316,18 @@ def block_user(request, user_id):
             )
             messages.success(request, f"{user_to_block.username} has been blocked.")
         
-        return redirect('dashboard')
+        return redirect('user_dashboard')
     
-    return render(request, 'chat/block_user.html', {'user_to_block': user_to_block})
+    return render(request, 'chat/block_user.html', {
+        'user_to_block': user_to_block,
+        'already_blocked': BlockedUser.objects.filter(blocker=request.user, blocked=user_to_block).exists(),
+    })
+
+@login_required
+def unblock_user(request, user_id):
+    if request.method == 'POST':
+        blocked_user = get_object_or_404(BlockedUser, blocker=request.user, blocked_id=user_id)
+        # delete() on the instance so the block cache is invalidated
+        blocked_user.delete()
+        messages.success(request, f"{blocked_user.blocked.username} has been unblocked.")
+    return redirect('user_dashboard')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from dashboard.stats import rollup_daily_stats
+
+class Command(BaseCommand):
+    help = 'Recompute the daily platform stats shown on the admin dashboard from the source tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=90,
+            help='Number of days to recompute, ending today (default 90)',
+        )
+
+    def handle(self, *args, **options):
+        written = rollup_daily_stats(max(options['days'], 1))
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {written} days of platform stats.'))
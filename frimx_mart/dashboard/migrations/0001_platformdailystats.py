@@ -0,0 +1,39 @@
+# Generated by Django 5.2.10 on 2026-10-18 08:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlatformDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('new_users', models.IntegerField(default=0)),
+                ('new_listings', models.IntegerField(default=0)),
+                ('new_chats', models.IntegerField(default=0)),
+                ('new_messages', models.IntegerField(default=0)),
+                ('new_promotions', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_users', models.IntegerField(default=0)),
+                ('total_listings', models.IntegerField(default=0)),
+                ('active_listings', models.IntegerField(default=0)),
+                ('boosted_listings', models.IntegerField(default=0)),
+                ('total_chats', models.IntegerField(default=0)),
+                ('active_chats', models.IntegerField(default=0)),
+                ('total_messages', models.IntegerField(default=0)),
+                ('total_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name_plural': 'platform daily stats',
+                'ordering': ['-date'],
+            },
+        ),
+    ]
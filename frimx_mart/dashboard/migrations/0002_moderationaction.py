@@ -0,0 +1,31 @@
+# Generated by Django 5.2.10 on 2026-10-18 08:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0001_platformdailystats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModerationAction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('deactivate', 'Deactivate'), ('boost', 'Approve boost'), ('feature', 'Feature'), ('spam', 'Mark as spam')], max_length=20)),
+                ('listing_ids', models.JSONField(default=list)),
+                ('listing_count', models.PositiveIntegerField(default=0)),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('moderator', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='moderation_actions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
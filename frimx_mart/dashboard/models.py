@@ -1,3 +1,63 @@
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+
+class PlatformDailyStats(models.Model):
+    """
+    One row per day of platform activity for the admin dashboard, see
+    dashboard/stats.py. The new_* fields and revenue count what was created
+    that day, the total_* and other counts are the state at the end of it.
+    """
+    date = models.DateField(unique=True)
+
+    # Created during the day
+    new_users = models.IntegerField(default=0)
+    new_listings = models.IntegerField(default=0)
+    new_chats = models.IntegerField(default=0)
+    new_messages = models.IntegerField(default=0)
+    new_promotions = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    # Totals at the end of the day
+    total_users = models.IntegerField(default=0)
+    total_listings = models.IntegerField(default=0)
+    active_listings = models.IntegerField(default=0)
+    boosted_listings = models.IntegerField(default=0)
+    total_chats = models.IntegerField(default=0)
+    active_chats = models.IntegerField(default=0)
+    total_messages = models.IntegerField(default=0)
+    total_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['-date']
+        verbose_name_plural = 'platform daily stats'
+
+    def __str__(self):
+        return f"Platform stats {self.date}"
+
+
+MODERATION_ACTIONS = [
+    ('deactivate', 'Deactivate'),
+    ('boost', 'Approve boost'),
+    ('feature', 'Feature'),
+    ('spam', 'Mark as spam'),
+]
+
+
+class ModerationAction(models.Model):
+    """Audit record of one moderation batch, see dashboard/moderation.py"""
+    moderator = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='moderation_actions'
+    )
+    action = models.CharField(max_length=20, choices=MODERATION_ACTIONS)
+    # Listings the action changed, and options such as {'days': 7} for boosts
+    listing_ids = models.JSONField(default=list)
+    listing_count = models.PositiveIntegerField(default=0)
+    params = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.get_action_display()} x{self.listing_count} by {self.moderator}"
@@ -0,0 +1,110 @@
+"""
+Bulk moderation of listings.
+
+Every action is applied to the selected listings with one set-based UPDATE
+and recorded as one ModerationAction, instead of a save() per listing. As
+queryset.update() bypasses the Listing signals, apply_moderation() does
+their bookkeeping itself from the state the rows had before the update:
+category counts, home page cache sections and the dashboard stats.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from listings import home_cache
+from listings.counters import adjust_category_counts, counted_category_id
+from listings.models import Listing
+from reports.models import Report
+from .models import ModerationAction
+from .stats import listing_stats_state, record
+
+# Largest selection applied as one batch
+MAX_BATCH_SIZE = 500
+DEFAULT_BOOST_DAYS = 7
+
+# Listing state loaded before an update, the same keys as
+# listings.signals.listing_state() uses for the fields involved
+STATE_FIELDS = ('category_id', 'is_active', 'is_sold', 'is_featured', 'is_boosted')
+
+
+class ModerationError(ValueError):
+    pass
+
+
+def _changes(action, now, days):
+    """(filter selecting the rows the action changes, field updates)"""
+    if action in ('deactivate', 'spam'):
+        return {'is_active': True}, {'is_active': False}
+    if action == 'feature':
+        return {'is_featured': False}, {'is_featured': True}
+    if action == 'boost':
+        # Approving again restarts the boost period
+        return {}, {'is_boosted': True, 'boosted_until': now + timedelta(days=days)}
+    raise ModerationError(f'Unknown moderation action: {action}')
+
+
+def apply_moderation(moderator, action, listing_ids, days=DEFAULT_BOOST_DAYS):
+    """
+    Apply action to the listings with the given ids, return the
+    ModerationAction recorded for the batch.
+    """
+    listing_ids = list(dict.fromkeys(listing_ids))
+    if not listing_ids:
+        raise ModerationError('No listings selected.')
+    if len(listing_ids) > MAX_BATCH_SIZE:
+        raise ModerationError(f'Select at most {MAX_BATCH_SIZE} listings at a time.')
+    if action == 'boost' and days < 1:
+        raise ModerationError('Boosts last at least one day.')
+
+    now = timezone.now()
+    only_changed, updates = _changes(action, now, days)
+    params = {'days': days} if action == 'boost' else {}
+
+    with transaction.atomic():
+        listings = Listing.objects.select_for_update().filter(id__in=listing_ids, **only_changed)
+        old_rows = list(listings.values('id', *STATE_FIELDS))
+        changed_ids = [row['id'] for row in old_rows]
+        if changed_ids:
+            Listing.objects.filter(id__in=changed_ids).update(updated_at=now, **updates)
+
+        category_deltas = Counter()
+        stats_deltas = Counter()
+        sections = set()
+        for old_values in old_rows:
+            new_values = {**old_values, **{k: v for k, v in updates.items() if k in STATE_FIELDS}}
+            category_deltas[counted_category_id(old_values)] -= 1
+            category_deltas[counted_category_id(new_values)] += 1
+            for field, count in listing_stats_state(old_values).items():
+                stats_deltas[field] -= count
+            for field, count in listing_stats_state(new_values).items():
+                stats_deltas[field] += count
+            sections.update(home_cache.sections_for_listing_change(old_values, new_values))
+
+        category_deltas = {
+            category_id: delta for category_id, delta in category_deltas.items() if category_id and delta
+        }
+        if category_deltas:
+            adjust_category_counts(category_deltas)
+            sections.add(home_cache.CATEGORIES)
+        stats_deltas = {field: delta for field, delta in stats_deltas.items() if delta}
+        if stats_deltas:
+            record(**stats_deltas)
+
+        if action == 'spam':
+            # Reports about these listings are settled by the action
+            Report.objects.filter(listing_id__in=listing_ids, status='pending').update(
+                status='resolved', resolved_at=now, resolved_by=moderator,
+                resolution_notes='Listing marked as spam',
+            )
+
+        audit = ModerationAction.objects.create(
+            moderator=moderator,
+            action=action,
+            listing_ids=[str(listing_id) for listing_id in changed_ids],
+            listing_count=len(changed_ids),
+            params=params,
+        )
+        transaction.on_commit(lambda: home_cache.bump_sections(*sections))
+    return audit
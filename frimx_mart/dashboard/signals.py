@@ -0,0 +1,61 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from chat.models import ChatThread, Message
+from listings.models import Promotion
+from .stats import record
+
+User = get_user_model()
+
+# Listing changes are recorded from listings.signals, which knows the state
+# a listing was loaded with
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if created:
+        record(new_users=1, total_users=1)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    record(total_users=-1)
+
+
+@receiver(post_save, sender=ChatThread)
+def thread_saved(sender, instance, created, **kwargs):
+    if created:
+        record(new_chats=1, total_chats=1, active_chats=int(instance.is_active))
+    else:
+        loaded = getattr(instance, '_loaded_values', None)
+        if loaded and loaded.get('is_active') != instance.is_active:
+            record(active_chats=1 if instance.is_active else -1)
+    instance._loaded_values = {**getattr(instance, '_loaded_values', {}), 'is_active': instance.is_active}
+
+
+@receiver(post_delete, sender=ChatThread)
+def thread_deleted(sender, instance, **kwargs):
+    record(total_chats=-1, active_chats=-int(instance.is_active))
+
+
+@receiver(post_save, sender=Message)
+def message_saved(sender, instance, created, **kwargs):
+    if created:
+        record(new_messages=1, total_messages=1)
+
+
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance, **kwargs):
+    record(total_messages=-1)
+
+
+@receiver(post_save, sender=Promotion)
+def promotion_saved(sender, instance, created, **kwargs):
+    if created:
+        record(new_promotions=1, revenue=instance.cost, total_revenue=instance.cost)
+
+
+@receiver(post_delete, sender=Promotion)
+def promotion_deleted(sender, instance, **kwargs):
+    record(total_revenue=-instance.cost)
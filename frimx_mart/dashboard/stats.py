@@ -0,0 +1,240 @@
+"""
+Daily platform statistics for the admin dashboard.
+
+Signal handlers in dashboard/signals.py, and listing_saved/listing_deleted
+in listings/signals.py, record deltas such as new_users=1 or
+active_listings=-1 once their transaction commits. Like listing views (see
+listings/activity.py) the deltas are kept in a BufferedCounter and written
+by a background thread of each process every PLATFORM_STATS_FLUSH_INTERVAL
+seconds, with one UPDATE for the new_* fields of the day and one for the
+totals of that day and every later one. The dashboard lags behind by up to
+that interval. The row of a new day starts from the totals of the last one.
+
+rollup_daily_stats() recomputes the rows from the source tables, which
+repairs drift from queryset.update() calls that bypass the signals, from
+boosts that ran out, or from deltas lost in a crash. Run it daily with the
+rollup_platform_stats command.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from listings.buffers import BufferedCounter
+
+FLUSH_INTERVAL = getattr(settings, 'PLATFORM_STATS_FLUSH_INTERVAL', 10)
+
+FLOW_FIELDS = (
+    'new_users', 'new_listings', 'new_chats', 'new_messages', 'new_promotions', 'revenue',
+)
+TOTAL_FIELDS = (
+    'total_users', 'total_listings', 'active_listings', 'boosted_listings',
+    'total_chats', 'active_chats', 'total_messages', 'total_revenue',
+)
+# Totals that depend on the current state of rows rather than on when they
+# were created, the rollup can only compute them for today
+STATE_FIELDS = ('active_listings', 'boosted_listings', 'active_chats')
+
+
+def ensure_day(day):
+    """Create the row of day from the totals of the last earlier one."""
+    from .models import PlatformDailyStats
+
+    if PlatformDailyStats.objects.filter(date=day).exists():
+        return
+    previous = PlatformDailyStats.objects.filter(date__lt=day).order_by('-date').values(
+        *TOTAL_FIELDS
+    ).first()
+    PlatformDailyStats.objects.get_or_create(date=day, defaults=previous or {})
+
+
+def apply_deltas(day, deltas):
+    from .models import PlatformDailyStats
+
+    ensure_day(day)
+    flows = {field: F(field) + delta for field, delta in deltas.items() if field in FLOW_FIELDS and delta}
+    totals = {field: F(field) + delta for field, delta in deltas.items() if field in TOTAL_FIELDS and delta}
+    if flows:
+        PlatformDailyStats.objects.filter(date=day).update(**flows)
+    if totals:
+        # A total carried into later days changes with them
+        PlatformDailyStats.objects.filter(date__gte=day).update(**totals)
+
+
+class StatsBuffer(BufferedCounter):
+    """Deltas keyed by (day, field)."""
+    name = 'platform stats'
+
+    def write(self, pending):
+        by_day = defaultdict(dict)
+        for (day, field), delta in pending.items():
+            by_day[day][field] = delta
+        for day in sorted(by_day):
+            apply_deltas(day, by_day[day])
+
+
+stats_buffer = StatsBuffer(FLUSH_INTERVAL)
+
+
+def record(**deltas):
+    """Count deltas towards today's stats once the current transaction commits."""
+    day = timezone.localdate()
+
+    def add():
+        for field, delta in deltas.items():
+            stats_buffer.add((day, field), delta)
+    transaction.on_commit(add)
+
+
+def listing_stats_state(values):
+    return {
+        'active_listings': int(bool(values.get('is_active') and not values.get('is_sold'))),
+        'boosted_listings': int(bool(values.get('is_boosted'))),
+    }
+
+
+def record_listing_change(old_values, new_values, created=False):
+    """
+    Record a listing change given its listings.signals.listing_state() before
+    and after, None for a listing that was created or deleted.
+    """
+    deltas = Counter()
+    if created:
+        deltas.update(new_listings=1, total_listings=1)
+    elif new_values is None:
+        deltas['total_listings'] -= 1
+    if old_values is None and not created:
+        # Not loaded from the database, whether its state changed is unknown
+        old_values = new_values
+    for values, sign in ((old_values, -1), (new_values, 1)):
+        if values:
+            for field, count in listing_stats_state(values).items():
+                deltas[field] += sign * count
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if deltas:
+        record(**deltas)
+
+
+def _daily(queryset, date_field, start, **aggregates):
+    """{day: {name: value}} of aggregates over the rows created since start."""
+    rows = queryset.filter(**{f'{date_field}__gte': start}).annotate(
+        day=TruncDate(date_field)
+    ).values('day').annotate(**aggregates).order_by()
+    return {row.pop('day'): row for row in rows}
+
+
+def rollup_daily_stats(days=90):
+    """
+    Recompute the rows of the last days days from the source tables, return
+    the number of rows written. The state dependent totals (active and
+    boosted listings, active chats) are only recomputed for today, older
+    rows keep the values recorded on the day.
+    """
+    from django.contrib.auth import get_user_model
+    from chat.models import ChatThread, Message
+    from listings.models import Listing, Promotion
+    from .models import PlatformDailyStats
+
+    User = get_user_model()
+    today = timezone.localdate()
+    first_day = today - timedelta(days=days - 1)
+    start = timezone.make_aware(datetime.combine(first_day, datetime.min.time()))
+
+    # (new_* field, total field, source rows, their creation date, aggregate)
+    sources = [
+        ('new_users', 'total_users', User.objects.all(), 'date_joined', Count('pk')),
+        ('new_listings', 'total_listings', Listing.objects.all(), 'created_at', Count('pk')),
+        ('new_chats', 'total_chats', ChatThread.objects.all(), 'created_at', Count('pk')),
+        ('new_messages', 'total_messages', Message.objects.all(), 'sent_at', Count('pk')),
+        ('new_promotions', None, Promotion.objects.all(), 'created_at', Count('pk')),
+        ('revenue', 'total_revenue', Promotion.objects.all(), 'created_at', Sum('cost')),
+    ]
+    flows = defaultdict(Counter)
+    totals = Counter()
+    for flow_field, total_field, queryset, date_field, aggregate in sources:
+        if total_field:
+            totals[total_field] = queryset.filter(**{f'{date_field}__lt': start}).aggregate(
+                value=aggregate
+            )['value'] or 0
+        for day, row in _daily(queryset, date_field, start, value=aggregate).items():
+            flows[day][flow_field] = row['value'] or 0
+
+    rows = []
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        row = PlatformDailyStats(date=day)
+        for flow_field, total_field, *_ in sources:
+            setattr(row, flow_field, flows[day][flow_field])
+            if total_field:
+                totals[total_field] += flows[day][flow_field]
+                setattr(row, total_field, totals[total_field])
+        rows.append(row)
+
+    today_row = rows[-1]
+    today_row.active_listings = Listing.objects.filter(is_active=True, is_sold=False).count()
+    today_row.boosted_listings = Listing.objects.filter(
+        is_boosted=True, boosted_until__gt=timezone.now()
+    ).count()
+    today_row.active_chats = ChatThread.objects.filter(is_active=True).count()
+
+    update_fields = [field for field in FLOW_FIELDS + TOTAL_FIELDS if field not in STATE_FIELDS]
+    with transaction.atomic():
+        PlatformDailyStats.objects.bulk_create(
+            rows[:-1], update_conflicts=True, unique_fields=['date'], update_fields=update_fields
+        )
+        PlatformDailyStats.objects.bulk_create(
+            [today_row], update_conflicts=True, unique_fields=['date'],
+            update_fields=list(FLOW_FIELDS + TOTAL_FIELDS)
+        )
+    return len(rows)
+
+
+def daily_stats(days=90):
+    """
+    PlatformDailyStats of the last days days oldest first, in one query. Days
+    without a row get zero new_* counts and the totals of the day before.
+    """
+    from .models import PlatformDailyStats
+
+    today = timezone.localdate()
+    first_day = today - timedelta(days=days - 1)
+    # The last days rows reach back past first_day whenever a day in the
+    # window has no row, so the totals to carry in are part of the same query
+    stored = {
+        row.date: row
+        for row in PlatformDailyStats.objects.filter(date__lte=today).order_by('-date')[:days]
+    }
+    earlier = [day for day in stored if day < first_day]
+    previous = stored[max(earlier)] if earlier else None
+    series = []
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        row = stored.get(day)
+        if row is None:
+            row = PlatformDailyStats(date=day, revenue=Decimal(0))
+            if previous is not None:
+                for field in TOTAL_FIELDS:
+                    setattr(row, field, getattr(previous, field))
+        series.append(row)
+        previous = row
+    return series
+
+
+def summarize(series, field):
+    """Sum of field over series."""
+    return sum((getattr(row, field) for row in series), 0)
+
+
+def chart_points(series, field):
+    """Bars for dashboard/includes/bar_chart.html, height in percent of the largest."""
+    values = [getattr(row, field) for row in series]
+    largest = max(values, default=0) or 1
+    return [
+        {'date': row.date, 'value': value, 'height': round(value * 100 / largest)}
+        for row, value in zip(series, values)
+    ]
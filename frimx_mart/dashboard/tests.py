@@ -1,3 +1,189 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.utils import timezone
+
+from chat.models import ChatThread, Message
+from listings.models import Category, Listing, Promotion
+from listings.activity import activity_counter
+from listings.testing import flush_immediately, make_listing
+from reports.models import Report
+from .moderation import apply_moderation, ModerationError, MAX_BATCH_SIZE
+from .models import ModerationAction, PlatformDailyStats
+from .stats import FLOW_FIELDS, TOTAL_FIELDS, rollup_daily_stats, stats_buffer
+
+User = get_user_model()
+
+
+class BulkModerationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.moderator = User.objects.create_user('moderator', 'moderator@example.com', 'password', is_staff=True)
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        cls.category = Category.objects.create(name='Phones')
+
+    def setUp(self):
+        flush_immediately(self, stats_buffer)
+
+    def moderate(self, action, listings, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return apply_moderation(self.moderator, action, [listing.id for listing in listings], **kwargs)
+
+    def today(self):
+        return PlatformDailyStats.objects.get(date=timezone.localdate())
+
+    def category_count(self):
+        return Category.objects.get(pk=self.category.pk).active_listing_count
+
+    def test_deactivate_matches_saving_each_listing(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            active = [make_listing(self.seller, category=self.category) for _ in range(3)]
+            hidden = make_listing(self.seller, category=self.category, is_active=False)
+            sold = make_listing(self.seller, category=self.category, is_sold=True)
+        self.assertEqual(self.category_count(), 3)
+        self.assertEqual(self.today().active_listings, 3)
+
+        audit = self.moderate('deactivate', [*active[:2], hidden, sold])
+
+        self.assertEqual(self.category_count(), 1)
+        # The sold listing was deactivated too but never counted as active,
+        # the hidden one was not changed
+        self.assertEqual(self.today().active_listings, 1)
+        self.assertEqual(audit.listing_count, 3)
+        self.assertEqual(
+            set(Listing.objects.filter(is_active=False).values_list('id', flat=True)),
+            {active[0].id, active[1].id, hidden.id, sold.id},
+        )
+
+    def test_audit_records_only_the_listings_changed(self):
+        listings = [make_listing(self.seller) for _ in range(2)]
+        make_listing(self.seller)
+
+        audit = self.moderate('feature', [*listings, listings[0]])
+        again = self.moderate('feature', listings)
+
+        self.assertEqual(ModerationAction.objects.count(), 2)
+        self.assertEqual(
+            (audit.moderator, audit.action, audit.listing_count), (self.moderator, 'feature', 2)
+        )
+        self.assertEqual(set(audit.listing_ids), {str(listing.id) for listing in listings})
+        self.assertEqual((again.listing_count, again.listing_ids), (0, []))
+        self.assertEqual(Listing.objects.filter(is_featured=True).count(), 2)
+
+    def test_boost_counts_newly_boosted_listings_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            boosted = make_listing(self.seller, is_boosted=True, boosted_until=timezone.now())
+            plain = make_listing(self.seller)
+
+        audit = self.moderate('boost', [boosted, plain], days=3)
+
+        self.assertEqual(self.today().boosted_listings, 2)
+        self.assertEqual(audit.params, {'days': 3})
+        for listing in Listing.objects.filter(id__in=[boosted.id, plain.id]):
+            self.assertTrue(listing.is_boosted)
+            self.assertGreater(listing.boosted_until, timezone.now() + timedelta(days=2))
+
+    def test_spam_resolves_pending_reports(self):
+        listing = make_listing(self.seller, category=self.category)
+        reporter = User.objects.create_user('reporter', 'reporter@example.com', 'password')
+        pending = Report.objects.create(reporter=reporter, listing=listing, reason='spam', description='Spam')
+        dismissed = Report.objects.create(
+            reporter=reporter, listing=listing, reason='fake', description='Fake', status='dismissed'
+        )
+
+        self.moderate('spam', [listing])
+
+        pending.refresh_from_db()
+        dismissed.refresh_from_db()
+        self.assertEqual((pending.status, pending.resolved_by), ('resolved', self.moderator))
+        self.assertIsNotNone(pending.resolved_at)
+        self.assertEqual(dismissed.status, 'dismissed')
+        self.assertEqual(self.category_count(), 0)
+
+    def test_invalid_requests_are_rejected(self):
+        listing = make_listing(self.seller)
+        for action, ids, kwargs in [
+            ('deactivate', [], {}),
+            ('delete', [listing.id], {}),
+            ('boost', [listing.id], {'days': 0}),
+            ('feature', [listing.id] * 2 + list(range(MAX_BATCH_SIZE)), {}),
+        ]:
+            with self.subTest(action=action), self.assertRaises(ModerationError):
+                apply_moderation(self.moderator, action, ids, **kwargs)
+        self.assertFalse(ModerationAction.objects.exists())
+
+
+class RecordedStatsTests(TestCase):
+    """The deltas recorded by the signal handlers add up to what the rollup recounts."""
+
+    def setUp(self):
+        flush_immediately(self, stats_buffer, activity_counter)
+
+    def recorded(self, fields=FLOW_FIELDS + TOTAL_FIELDS):
+        return PlatformDailyStats.objects.filter(date=timezone.localdate()).values(*fields).get()
+
+    def assert_matches_rollup(self, fields=FLOW_FIELDS + TOTAL_FIELDS):
+        recorded = self.recorded(fields)
+        rollup_daily_stats(days=1)
+        self.assertEqual(recorded, self.recorded(fields))
+
+    def test_recorded_stats_match_the_rollup(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+            buyer = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+            listing = make_listing(seller)
+            make_listing(seller, is_sold=True)
+            make_listing(seller, is_boosted=True, boosted_until=timezone.now() + timedelta(days=1))
+            thread = ChatThread.objects.create(listing=listing, buyer=buyer, seller=seller)
+            for content in ['Hello', 'Still available?']:
+                Message.objects.create(thread=thread, sender=buyer, content=content)
+            Promotion.objects.create(
+                listing=listing, promotion_type='boost', cost=Decimal('25.50'),
+                start_date=timezone.now(), end_date=timezone.now() + timedelta(days=7),
+            )
+
+        self.assertEqual(
+            {field: value for field, value in self.recorded().items() if field.startswith('new_')},
+            {'new_users': 2, 'new_listings': 3, 'new_chats': 1, 'new_messages': 2, 'new_promotions': 1},
+        )
+        self.assertEqual(self.recorded()['active_listings'], 2)
+        self.assert_matches_rollup()
+
+    def test_changes_and_deletions_match_the_rollup(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+            buyer = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+            other = User.objects.create_user('other', 'other@example.com', 'password')
+            listing = make_listing(seller)
+            thread = ChatThread.objects.create(listing=listing, buyer=buyer, seller=seller)
+            other_thread = ChatThread.objects.create(listing=listing, buyer=other, seller=seller)
+            message = Message.objects.create(thread=thread, sender=buyer, content='Hello')
+            Message.objects.create(thread=other_thread, sender=other, content='Hi')
+            promotion = Promotion.objects.create(
+                listing=listing, promotion_type='featured', cost=Decimal('10'),
+                start_date=timezone.now(), end_date=timezone.now() + timedelta(days=7),
+            )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            thread = ChatThread.objects.get(pk=thread.pk)
+            thread.is_active = False
+            thread.save()
+            message.delete()
+            promotion.delete()
+            # Takes their chat thread and message with them
+            other.delete()
+            listing = Listing.objects.get(pk=listing.pk)
+            listing.is_sold = True
+            listing.save()
 
-# Create your tests here.
+        recorded = self.recorded()
+        self.assertEqual(
+            (recorded['total_users'], recorded['total_chats'], recorded['active_chats'], recorded['total_messages']),
+            (2, 1, 0, 0),
+        )
+        self.assertEqual((recorded['active_listings'], recorded['total_revenue']), (0, 0))
+        # new_* count what was created during the day, deleted rows included,
+        # which the rollup can no longer see
+        self.assert_matches_rollup(TOTAL_FIELDS)
@@ -6,6 +6,7 @@ urlpatterns = [
     path('admin/', views.admin_dashboard, name='admin_dashboard'),
     path('manage-users/', views.manage_users, name='manage_users'),
     path('moderate-listings/', views.moderate_listings, name='moderate_listings'),
+    path('moderate-listings/bulk/', views.bulk_moderate_listings, name='bulk_moderate_listings'),
     path('approve-boost/<uuid:listing_id>/', views.approve_boost, name='approve_boost'),
 ]
 
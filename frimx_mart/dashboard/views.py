@@ -1,24 +1,34 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.db.models import Count, Sum, Q
-from django.utils import timezone
-from datetime import timedelta
+from django.core.exceptions import ValidationError
+from django.urls import reverse
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
 from accounts.models import User
 from listings.models import Listing, Category
-from chat.models import ChatThread, Message
+from chat.models import ChatThread
+from listings.activity import seller_daily_series, seller_top_listings
+from listings.pagination import CursorPaginator
 from reports.models import Report
+from .moderation import DEFAULT_BOOST_DAYS, ModerationError, apply_moderation
+from .stats import chart_points, daily_stats, rollup_daily_stats, summarize
 
 @login_required
 def user_dashboard(request):
     user = request.user
     
     # User stats
-    active_listings = user.listings.filter(is_active=True, is_sold=False).count()
-    sold_listings = user.listings.filter(is_sold=True).count()
-    total_revenue = user.listings.filter(is_sold=True).aggregate(
-        total=Sum('price')
-    )['total'] or 0
+    totals = user.listings.aggregate(
+        active=Count('pk', filter=Q(is_active=True, is_sold=False)),
+        sold=Count('pk', filter=Q(is_sold=True)),
+        revenue=Sum('price', filter=Q(is_sold=True)),
+    )
+    
+    # Daily views, saves and chat starts of the last 30 days, from the
+    # pre-aggregated ListingDailyStats rows
+    activity = seller_daily_series(user.pk, 30)
     
     # Recent activity
     recent_listings = user.listings.order_by('-created_at')[:5]
@@ -27,12 +37,19 @@ def user_dashboard(request):
     ).order_by('-updated_at')[:5]
     
     # Saved listings
-    saved_listings = user.saved_listings.all().select_related('listing')[:5]
+    saved_listings = user.saved_listings.all().select_related('listing__primary_image')[:5]
     
     context = {
-        'active_listings': active_listings,
-        'sold_listings': sold_listings,
-        'total_revenue': total_revenue,
+        'active_listings': totals['active'],
+        'sold_listings': totals['sold'],
+        'total_revenue': totals['revenue'] or 0,
+        'views_30_days': summarize(activity, 'views'),
+        'saves_30_days': summarize(activity, 'saves'),
+        'chat_starts_30_days': summarize(activity, 'chat_starts'),
+        'views_chart': chart_points(activity, 'views'),
+        'saves_chart': chart_points(activity, 'saves'),
+        'chat_starts_chart': chart_points(activity, 'chat_starts'),
+        'top_listings': seller_top_listings(user.pk, 30),
         'recent_listings': recent_listings,
         'recent_chats': recent_chats,
         'saved_listings': saved_listings,
@@ -42,49 +59,58 @@ def user_dashboard(request):
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def admin_dashboard(request):
-    # Platform stats
-    total_users = User.objects.count()
-    new_users_today = User.objects.filter(
-        date_joined__date=timezone.now().date()
-    ).count()
-    
-    total_listings = Listing.objects.count()
-    active_listings = Listing.objects.filter(is_active=True, is_sold=False).count()
-    boosted_listings = Listing.objects.filter(
-        is_boosted=True,
-        boosted_until__gt=timezone.now()
-    ).count()
-    
-    total_chats = ChatThread.objects.count()
-    active_chats = ChatThread.objects.filter(is_active=True).count()
-    total_messages = Message.objects.count()
-    
-    # Revenue stats
-    total_revenue = 10000  # Placeholder - implement actual revenue tracking
-    today_revenue = 500    # Placeholder
+    # Platform stats come from the daily rollup, one query for 90 days
+    series = daily_stats(90)
+    if not any(row.pk for row in series):
+        # Nothing recorded yet, build the history once
+        rollup_daily_stats(90)
+        series = daily_stats(90)
+    today = series[-1]
+    last_30_days = series[-30:]
+    
+    trends = [
+        {
+            'label': label,
+            'today': getattr(today, field),
+            'last_30_days': summarize(last_30_days, field),
+            'last_90_days': summarize(series, field),
+            'is_money': field == 'revenue',
+        }
+        for label, field in [
+            ('New users', 'new_users'),
+            ('New listings', 'new_listings'),
+            ('New chats', 'new_chats'),
+            ('Messages', 'new_messages'),
+            ('Promotions', 'new_promotions'),
+            ('Revenue', 'revenue'),
+        ]
+    ]
     
     # Recent reports
     pending_reports = Report.objects.filter(status='pending').order_by('-created_at')[:10]
     
     # Recent listings for moderation
-    recent_listings = Listing.objects.filter(is_active=True).order_by('-created_at')[:10]
+    recent_listings = Listing.objects.filter(is_active=True).select_related(
+        'primary_image'
+    ).order_by('-created_at')[:10]
     
     # Category distribution
-    category_stats = Category.objects.annotate(
-        listing_count=Count('listing')
-    ).order_by('-listing_count')[:10]
+    category_stats = Category.objects.order_by('-active_listing_count')[:10]
     
     context = {
-        'total_users': total_users,
-        'new_users_today': new_users_today,
-        'total_listings': total_listings,
-        'active_listings': active_listings,
-        'boosted_listings': boosted_listings,
-        'total_chats': total_chats,
-        'active_chats': active_chats,
-        'total_messages': total_messages,
-        'total_revenue': total_revenue,
-        'today_revenue': today_revenue,
+        'total_users': today.total_users,
+        'new_users_today': today.new_users,
+        'total_listings': today.total_listings,
+        'active_listings': today.active_listings,
+        'boosted_listings': today.boosted_listings,
+        'total_chats': today.total_chats,
+        'active_chats': today.active_chats,
+        'total_messages': today.total_messages,
+        'total_revenue': today.total_revenue,
+        'today_revenue': today.revenue,
+        'trends': trends,
+        'listings_chart': chart_points(last_30_days, 'new_listings'),
+        'users_chart': chart_points(last_30_days, 'new_users'),
         'pending_reports': pending_reports,
         'recent_listings': recent_listings,
         'category_stats': category_stats,
@@ -94,20 +120,31 @@ def admin_dashboard(request):
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def manage_users(request):
-    users = User.objects.all().order_by('-date_joined')
-    
-    # Filters
-    search = request.GET.get('search')
+    # Only the columns the table shows. The ratings are the stored aggregates
+    # and the listing count a subquery run for the rows of the page only
+    listing_count = Listing.objects.filter(seller=OuterRef('pk')).order_by().values(
+        'seller'
+    ).annotate(n=Count('pk')).values('n')
+    users = User.objects.only(
+        'username', 'first_name', 'last_name', 'email', 'date_joined', 'profile_image',
+        'is_staff', 'is_active', 'is_verified', 'rating_sum', 'rating_count',
+    ).annotate(listing_count=Coalesce(Subquery(listing_count), 0))
+    
+    # Prefix search, served by the case-insensitive username and email indexes
+    search = request.GET.get('search', '').strip()
     if search:
         users = users.filter(
-            Q(username__icontains=search) |
-            Q(email__icontains=search) |
-            Q(first_name__icontains=search) |
-            Q(last_name__icontains=search)
+            Q(username__istartswith=search) |
+            Q(email__istartswith=search)
         )
     
+    paginator = CursorPaginator(users, 50, 'date_joined', descending=True)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    
     context = {
-        'users': users,
+        'users': page_obj,
+        'page_obj': page_obj,
+        'search': search,
     }
     return render(request, 'dashboard/manage_users.html', context)
 
@@ -127,21 +164,52 @@ def moderate_listings(request):
     elif status == 'pending':
         listings = listings.filter(is_active=True, is_boosted=False)
     
+    paginator = CursorPaginator(listings.select_related('seller'), 50, 'created_at', descending=True)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    
     context = {
-        'listings': listings,
+        'listings': page_obj,
+        'page_obj': page_obj,
     }
     return render(request, 'dashboard/moderate_listings.html', context)
 
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+def bulk_moderate_listings(request):
+    """Apply one moderation action to the listings ticked on moderate_listings"""
+    next_url = request.POST.get('next')
+    if not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        next_url = reverse('moderate_listings')
+    if request.method != 'POST':
+        return redirect(next_url)
+    
+    try:
+        days = int(request.POST.get('days') or DEFAULT_BOOST_DAYS)
+    except ValueError:
+        days = DEFAULT_BOOST_DAYS
+    try:
+        audit = apply_moderation(
+            request.user,
+            request.POST.get('action'),
+            request.POST.getlist('listing_ids'),
+            days=days,
+        )
+    except (ModerationError, ValidationError) as e:
+        messages.error(request, e.messages[0] if isinstance(e, ValidationError) else str(e))
+    else:
+        messages.success(
+            request, f'{audit.get_action_display()}: {audit.listing_count} listing(s) updated.'
+        )
+    return redirect(next_url)
+
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def approve_boost(request, listing_id):
     listing = get_object_or_404(Listing, id=listing_id)
     
     if request.method == 'POST':
-        listing.is_boosted = True
-        listing.boosted_until = timezone.now() + timedelta(days=7)
-        listing.save()
+        apply_moderation(request.user, 'boost', [listing.id], days=DEFAULT_BOOST_DAYS)
         messages.success(request, 'Listing boost approved!')
         return redirect('moderate_listings')
     
-    return render(request, 'dashboard/approve_boost.html', {'listing': listing})
\ No newline at end of file
+    return render(request, 'dashboard/approve_boost.html', {'listing': listing})
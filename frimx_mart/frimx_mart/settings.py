@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.humanize",
     "accounts",
     "listings",
     "chat",
@@ -242,8 +244,72 @@ LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'home'
 
+# Cache
+# The default local-memory cache is per process. With several Gunicorn
+# workers use a shared backend so cache invalidation reaches every worker, e.g.
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# CACHE_LOCATION=redis://127.0.0.1:6379
+# or CACHE_BACKEND=django.core.cache.backends.db.DatabaseCache with
+# CACHE_LOCATION=cache_table (run `python manage.py createcachetable`)
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        "LOCATION": os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+# Whether cache invalidation reaches every process
+SHARED_CACHE = CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+# Seconds to cache chat block lists and unread badges. They are updated on
+# change, which only reaches the other workers through a shared cache, so
+# without one they are read from the database every time (0)
+CHAT_BLOCK_CACHE_TIMEOUT = int(os.environ.get('CHAT_BLOCK_CACHE_TIMEOUT', '86400' if SHARED_CACHE else '0'))
+CHAT_UNREAD_CACHE_TIMEOUT = int(os.environ.get('CHAT_UNREAD_CACHE_TIMEOUT', '86400' if SHARED_CACHE else '0'))
+
+# Listing settings
+# Use keyset (cursor) pagination on the browse page for every request instead
+# of only when a ?cursor= parameter is present
+LISTING_CURSOR_PAGINATION = os.environ.get('LISTING_CURSOR_PAGINATION', 'False') == 'True'
+# Seconds to keep home page sections and browse page facet counts cached
+HOME_CACHE_TIMEOUT = int(os.environ.get('HOME_CACHE_TIMEOUT', '300'))
+FACET_CACHE_TIMEOUT = int(os.environ.get('FACET_CACHE_TIMEOUT', '120'))
+# Listing views and the daily listing stats of seller dashboards are buffered
+# in memory and written in bulk by a background thread of each process every
+# LISTING_VIEW_FLUSH_INTERVAL seconds (0 = on every event), or earlier once
+# LISTING_VIEW_FLUSH_THRESHOLD events are pending
+LISTING_VIEW_FLUSH_INTERVAL = int(os.environ.get('LISTING_VIEW_FLUSH_INTERVAL', '10'))
+LISTING_VIEW_FLUSH_THRESHOLD = int(os.environ.get('LISTING_VIEW_FLUSH_THRESHOLD', '500'))
+# Ignore repeat views from the same session for this many seconds (0 = off)
+LISTING_VIEW_DEDUP_SECONDS = int(os.environ.get('LISTING_VIEW_DEDUP_SECONDS', '0'))
+# Clear expired boosts and promotions from a background thread of each web
+# process every PROMOTION_SWEEP_INTERVAL seconds (0 = only the
+# expire_promotions command does it)
+PROMOTION_SWEEP_INTERVAL = int(os.environ.get('PROMOTION_SWEEP_INTERVAL', '0'))
+# Threads generating resized listing image variants after upload (0 = inline)
+IMAGE_VARIANT_WORKERS = int(os.environ.get('IMAGE_VARIANT_WORKERS', '2'))
+# Uploads larger than this (bytes / width x height) are rejected from their headers
+LISTING_IMAGE_MAX_BYTES = int(os.environ.get('LISTING_IMAGE_MAX_BYTES', str(10 * 1024 * 1024)))
+LISTING_IMAGE_MAX_PIXELS = int(os.environ.get('LISTING_IMAGE_MAX_PIXELS', '40000000'))
+
+# Admin dashboard stats are buffered in memory and written by a background
+# thread of each process every PLATFORM_STATS_FLUSH_INTERVAL seconds
+PLATFORM_STATS_FLUSH_INTERVAL = int(os.environ.get('PLATFORM_STATS_FLUSH_INTERVAL', '10'))
+
 # Chat settings
 MESSAGES_PER_PAGE = 50
+# New messages are pushed to open chats over Server-Sent Events when served
+# through frimx_mart.asgi. A WSGI server (runserver, gunicorn's sync workers)
+# holds back a streamed response until it ends, so there open chats
+# long-poll instead, each holding a worker for up to CHAT_LONG_POLL_TIMEOUT
+# seconds
+SERVED_OVER_ASGI = 'frimx_mart.asgi' in sys.modules
+CHAT_PUSH = os.environ.get('CHAT_PUSH', 'sse' if SERVED_OVER_ASGI else 'longpoll')
+CHAT_STREAM_HEARTBEAT = 15
+CHAT_STREAM_MAX_SECONDS = int(os.environ.get('CHAT_STREAM_MAX_SECONDS', '300'))
+CHAT_STREAM_RETRY_MS = 3000
+CHAT_LONG_POLL_TIMEOUT = int(os.environ.get('CHAT_LONG_POLL_TIMEOUT', '25'))
 
 # Email settings
 EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
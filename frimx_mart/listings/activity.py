@@ -0,0 +1,171 @@
+"""
+Daily views, saves and chat starts per listing for the seller dashboard.
+
+Events are added to a BufferedCounter (see listings/buffers.py) and flushed
+into ListingDailyStats every LISTING_VIEW_FLUSH_INTERVAL seconds or
+LISTING_VIEW_FLUSH_THRESHOLD events. A flush inserts the missing
+(listing, day) rows with one INSERT that ignores conflicts, then adds the
+counts with one UPDATE ... SET field = field + n per day, field and distinct
+n. Rows only exist for days a listing had activity. Views counted by
+listings/view_counter.py are added to Listing.views by the same flush.
+
+Undone saves and deleted chats are counted as -1 on the day they were made,
+which is where rollup_listing_stats() no longer finds them, never taking a
+count below 0. Views have no
+event table behind them, saves and chat starts do: the rollup recounts those
+two from SavedListing and ChatThread, repairing counts lost in a crash. Run
+it daily with the rollup_listing_stats command.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+
+from .buffers import BufferedCounter
+
+FLUSH_INTERVAL = getattr(settings, 'LISTING_VIEW_FLUSH_INTERVAL', 10)
+FLUSH_THRESHOLD = getattr(settings, 'LISTING_VIEW_FLUSH_THRESHOLD', 500)
+
+ACTIVITY_FIELDS = ('views', 'saves', 'chat_starts')
+
+
+class ActivityCounter(BufferedCounter):
+    """Deltas keyed by (day, field, listing_id)."""
+    name = 'listing activity'
+
+    def write(self, pending):
+        from .models import Listing, ListingDailyStats
+
+        listing_ids = {listing_id for _, _, listing_id in pending}
+        sellers = dict(Listing.objects.filter(id__in=listing_ids).values_list('id', 'seller_id'))
+        # Listings deleted in the meantime are dropped. Only increments need
+        # a row, a decrement without one has nothing left to take off.
+        ListingDailyStats.objects.bulk_create(
+            [
+                ListingDailyStats(listing_id=listing_id, seller_id=sellers[listing_id], date=day)
+                for day, listing_id in {
+                    (day, listing_id) for (day, _, listing_id), delta in pending.items() if delta > 0
+                }
+                if listing_id in sellers
+            ],
+            ignore_conflicts=True,
+        )
+        by_delta = defaultdict(list)
+        views = Counter()
+        for (day, field, listing_id), delta in pending.items():
+            by_delta[day, field, delta].append(listing_id)
+            if field == 'views':
+                views[listing_id] += delta
+        for (day, field, delta), ids in by_delta.items():
+            # Clamped at 0: a save or chat older than the rows, or than the
+            # last rollup, may be undone after its day was already counted
+            ListingDailyStats.objects.filter(listing_id__in=ids, date=day).update(
+                **{field: Greatest(F(field) + delta, 0)}
+            )
+
+        # Listing.views is written from the same flush, so it never drifts
+        # from the daily rows
+        by_delta = defaultdict(list)
+        for listing_id, delta in views.items():
+            by_delta[delta].append(listing_id)
+        for delta, ids in by_delta.items():
+            Listing.objects.filter(id__in=ids).update(views=F('views') + delta)
+
+
+activity_counter = ActivityCounter(FLUSH_INTERVAL, FLUSH_THRESHOLD)
+
+
+def count_activity(listing_id, field, count=1, day=None):
+    """Add count to the field of listing_id on day, today by default."""
+    activity_counter.add((day or timezone.localdate(), field, listing_id), count)
+
+
+def record_activity(listing_id, field, count=1, day=None):
+    """count_activity() once the current transaction commits."""
+    transaction.on_commit(lambda: count_activity(listing_id, field, count, day))
+
+
+def rollup_listing_stats(days=30):
+    """
+    Recount saves and chat starts of the last days days from the source
+    tables, return the number of rows written.
+    """
+    from chat.models import ChatThread
+    from .models import ListingDailyStats, SavedListing
+
+    first_day = timezone.localdate() - timedelta(days=days - 1)
+    start = timezone.make_aware(datetime.combine(first_day, datetime.min.time()))
+
+    counts = defaultdict(Counter)
+    sellers = {}
+    sources = [
+        ('saves', SavedListing.objects.all(), 'saved_at'),
+        ('chat_starts', ChatThread.objects.filter(listing__isnull=False), 'created_at'),
+    ]
+    for field, queryset, date_field in sources:
+        rows = queryset.filter(**{f'{date_field}__gte': start}).annotate(
+            day=TruncDate(date_field)
+        ).values('listing_id', 'listing__seller_id', 'day').annotate(n=Count('pk')).order_by()
+        for row in rows:
+            counts[row['listing_id'], row['day']][field] = row['n']
+            sellers[row['listing_id']] = row['listing__seller_id']
+
+    with transaction.atomic():
+        ListingDailyStats.objects.filter(date__gte=first_day).update(saves=0, chat_starts=0)
+        ListingDailyStats.objects.bulk_create(
+            [
+                ListingDailyStats(
+                    listing_id=listing_id, seller_id=sellers[listing_id], date=day,
+                    saves=fields['saves'], chat_starts=fields['chat_starts'],
+                )
+                for (listing_id, day), fields in counts.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['listing', 'date'],
+            update_fields=['saves', 'chat_starts'],
+        )
+    return len(counts)
+
+
+def seller_daily_series(seller_id, days=30):
+    """
+    ListingDailyStats summed over the listings of a seller for each of the
+    last days days, oldest first, zero for days without activity.
+    """
+    from .models import ListingDailyStats
+
+    first_day = timezone.localdate() - timedelta(days=days - 1)
+    totals = {
+        row['date']: row
+        for row in ListingDailyStats.objects.filter(seller_id=seller_id, date__gte=first_day).values(
+            'date'
+        ).annotate(**{f'{field}_sum': Sum(field) for field in ACTIVITY_FIELDS}).order_by()
+    }
+    series = []
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        row = totals.get(day, {})
+        series.append(ListingDailyStats(
+            date=day, **{field: row.get(f'{field}_sum') or 0 for field in ACTIVITY_FIELDS}
+        ))
+    return series
+
+
+def seller_top_listings(seller_id, days=30, limit=10):
+    """
+    The seller's listings with the most views over the last days days, as
+    dicts with listing_id, listing__title and views_sum, saves_sum and
+    chat_starts_sum.
+    """
+    from .models import ListingDailyStats
+
+    first_day = timezone.localdate() - timedelta(days=days - 1)
+    return ListingDailyStats.objects.filter(seller_id=seller_id, date__gte=first_day).values(
+        'listing_id', 'listing__title'
+    ).annotate(**{f'{field}_sum': Sum(field) for field in ACTIVITY_FIELDS}).order_by(
+        '-views_sum', '-saves_sum'
+    )[:limit]
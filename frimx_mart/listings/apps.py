@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ListingsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "listings"
+
+    def ready(self):
+        from . import expiry, signals  # noqa: F401
+        from .models import ListingImage
+        from .storage import track_blob_field
+        track_blob_field(ListingImage, 'image')
@@ -0,0 +1,121 @@
+"""
+In-process buffers for counters that are written to the database in bulk.
+
+A BufferedCounter sums deltas per key in memory and hands them to its
+write() method in one transaction. A daemon thread of each process flushes
+every flush_interval seconds, so a quiet process never holds deltas for
+longer than that. add() also flushes once flush_threshold deltas are
+pending, or on every add() when flush_interval is 0, and the buffer is
+flushed once more when the process exits. At most one interval of deltas per
+process is lost on a hard crash. When a flush fails its keys are written one
+at a time: keys the database rejects on their own are logged and dropped, and
+if none can be written the deltas are kept for the next flush.
+
+The thread is started by the first add() in a process rather than at import,
+so it runs in every forked web worker and never in management commands that
+do not count anything.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedCounter:
+    name = 'counters'
+
+    def __init__(self, flush_interval, flush_threshold=None):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._pending = Counter()
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        # Process that runs the flush thread, a forked child starts its own
+        self._thread_pid = None
+        atexit.register(self.flush)
+
+    def write(self, pending):
+        """Write a Counter of deltas by key to the database."""
+        raise NotImplementedError
+
+    def add(self, key, count=1):
+        with self._lock:
+            self._pending[key] += count
+            self._pending_total += abs(count)
+            due = self.flush_interval <= 0 or (
+                self.flush_threshold is not None and self._pending_total >= self.flush_threshold
+            )
+            start = self._thread_pid != os.getpid()
+            if start:
+                self._thread_pid = os.getpid()
+        if start:
+            self._start_thread()
+        if due:
+            self.flush()
+
+    def _start_thread(self):
+        if self.flush_interval <= 0:
+            return
+        thread = threading.Thread(target=self._run, name=f'flush-{self.name}', daemon=True)
+        thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def _take(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = Counter()
+            self._pending_total = 0
+        return pending
+
+    def flush(self):
+        """Write pending deltas to the database, return the number of keys written."""
+        pending = self._take()
+        pending = Counter({key: delta for key, delta in pending.items() if delta})
+        if not pending:
+            return 0
+        try:
+            with transaction.atomic():
+                self.write(pending)
+        except Exception:
+            logger.exception('Failed to flush %s, writing the keys one at a time', self.name)
+            return self._write_each(pending)
+        return len(pending)
+
+    def _write_each(self, pending):
+        """
+        Write the keys of a failed flush one at a time, so a key the database
+        rejects cannot hold back the others.
+        """
+        failed = Counter()
+        for key, delta in pending.items():
+            try:
+                with transaction.atomic():
+                    self.write(Counter({key: delta}))
+            except Exception:
+                failed[key] = delta
+        if len(failed) == len(pending):
+            # Nothing went through, most likely the database is unavailable:
+            # put the deltas back so the next flush retries them
+            self._restore(failed)
+            return 0
+        # The others were written, so these keys fail on their own
+        logger.error('Dropped %s deltas the database rejected: %r', self.name, dict(failed))
+        return len(pending) - len(failed)
+
+    def _restore(self, pending):
+        with self._lock:
+            self._pending.update(pending)
+            self._pending_total += sum(abs(delta) for delta in pending.values())
@@ -0,0 +1,78 @@
+"""
+Denormalized counters: active listing counts on Category and seller rating
+aggregates on User.
+
+A listing counts towards its category while it is active and unsold. The
+signal handlers in listings/signals.py apply +1/-1 deltas as listings change;
+code that bypasses signals with queryset.update() should call
+adjust_category_counts() itself, and reconcile_category_counts() repairs any
+drift.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from django.contrib.auth import get_user_model
+
+from .models import Category
+
+User = get_user_model()
+
+
+def counted_category_id(values):
+    """Return the category a listing counts towards, or None."""
+    if not values:
+        return None
+    if values.get('is_active') and not values.get('is_sold'):
+        return values.get('category_id')
+    return None
+
+
+def adjust_category_counts(deltas):
+    """Apply a {category_id: delta} mapping with atomic F() updates."""
+    with transaction.atomic():
+        for category_id, delta in deltas.items():
+            if not category_id or not delta:
+                continue
+            categories = Category.objects.filter(id=category_id)
+            if delta < 0:
+                # Never go below zero, reconcile fixes the count if it drifted
+                categories = categories.filter(active_listing_count__gte=-delta)
+            categories.update(active_listing_count=F('active_listing_count') + delta)
+
+
+def track_listing_change(old_values, new_values):
+    """Update category counts for a listing change, return True if any changed."""
+    old_category = counted_category_id(old_values)
+    new_category = counted_category_id(new_values)
+    if old_category == new_category:
+        return False
+    deltas = Counter()
+    deltas[old_category] -= 1
+    deltas[new_category] += 1
+    adjust_category_counts(deltas)
+    return True
+
+
+def reconcile_category_counts():
+    """Recount every category from the listings table, return the ones that drifted."""
+    categories = Category.objects.annotate(
+        actual=Count('listing', filter=Q(listing__is_active=True, listing__is_sold=False))
+    )
+    drifted = []
+    for category in categories:
+        if category.active_listing_count != category.actual:
+            category.active_listing_count = category.actual
+            drifted.append(category)
+    Category.objects.bulk_update(drifted, ['active_listing_count'])
+    return drifted
+
+
+def adjust_seller_rating(seller_id, rating, sign):
+    """Add (sign=1) or remove (sign=-1) one rating from a seller's aggregates."""
+    User.objects.filter(pk=seller_id).update(
+        rating_sum=F('rating_sum') + sign * rating,
+        rating_count=F('rating_count') + sign,
+        **{f'rating_{rating}_count': F(f'rating_{rating}_count') + sign}
+    )
@@ -0,0 +1,158 @@
+"""
+Expiry of boosts, promotions and promoted features.
+
+Listing.is_boosted and Promotion.is_active are cleared here once
+boosted_until / end_date has passed, so the read paths can filter on the
+flags alone (and the partial indexes on them) instead of comparing dates.
+A listing featured by a 'featured' promotion is unfeatured when its last
+active one ends. Listings featured by a moderator have no promotion and stay
+featured.
+
+Expired rows are found through the partial indexes on boosted_until and
+end_date and changed with one UPDATE per batch of SWEEP_BATCH_SIZE. As that
+bypasses the Listing signals, the home page cache and dashboard stats are
+adjusted here.
+
+expire_promotions() is run by the expire_promotions command from cron, or
+every PROMOTION_SWEEP_INTERVAL seconds by a background thread of each web
+process when that setting is above 0.
+"""
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import home_cache
+from .models import Listing, Promotion
+
+logger = logging.getLogger(__name__)
+
+SWEEP_BATCH_SIZE = 1000
+SWEEP_INTERVAL = getattr(settings, 'PROMOTION_SWEEP_INTERVAL', 0)
+
+
+def _expire_listings(queryset, updates, stats_field, now):
+    """Apply updates to queryset in batches, return the number of listings changed."""
+    from dashboard.stats import record
+
+    expired = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                queryset.select_for_update(skip_locked=True).values_list('id', flat=True)[:SWEEP_BATCH_SIZE]
+            )
+            if not ids:
+                break
+            # Only visible listings show up in a home page section
+            visible = Listing.objects.filter(id__in=ids, is_active=True, is_sold=False).exists()
+            Listing.objects.filter(id__in=ids).update(updated_at=now, **updates)
+            if stats_field:
+                record(**{stats_field: -len(ids)})
+            if visible:
+                transaction.on_commit(lambda: home_cache.bump_sections(*_sections(updates)))
+        expired += len(ids)
+        if len(ids) < SWEEP_BATCH_SIZE:
+            break
+    return expired
+
+
+def _sections(updates):
+    # The cards of the recent listings show the boost and featured badges
+    if 'is_boosted' in updates:
+        return home_cache.BOOSTED, home_cache.RECENT
+    return home_cache.FEATURED, home_cache.RECENT
+
+
+def expire_promotions(now=None):
+    """
+    Expire everything that ran out before now, return a Counter of the
+    number of boosts, promotions and features expired.
+    """
+    now = now or timezone.now()
+    expired = Counter()
+
+    expired['boosts'] = _expire_listings(
+        Listing.objects.filter(is_boosted=True).filter(
+            Q(boosted_until__lte=now) | Q(boosted_until__isnull=True)
+        ),
+        {'is_boosted': False},
+        'boosted_listings',
+        now,
+    )
+
+    featured_ids = set()
+    while True:
+        with transaction.atomic():
+            promotions = list(
+                Promotion.objects.select_for_update(skip_locked=True).filter(
+                    is_active=True, end_date__lte=now
+                ).values_list('id', 'listing_id', 'promotion_type')[:SWEEP_BATCH_SIZE]
+            )
+            if not promotions:
+                break
+            Promotion.objects.filter(id__in=[p[0] for p in promotions]).update(is_active=False)
+        expired['promotions'] += len(promotions)
+        featured_ids.update(listing_id for _, listing_id, kind in promotions if kind == 'featured')
+        if len(promotions) < SWEEP_BATCH_SIZE:
+            break
+
+    if featured_ids:
+        # Unless another featured promotion of the listing is still running
+        still_promoted = Promotion.objects.filter(
+            listing_id__in=featured_ids, promotion_type='featured', is_active=True
+        ).values('listing_id')
+        expired['features'] = _expire_listings(
+            Listing.objects.filter(id__in=featured_ids, is_featured=True).exclude(id__in=still_promoted),
+            {'is_featured': False},
+            None,
+            now,
+        )
+    return expired
+
+
+class PeriodicSweeper:
+    """Runs expire_promotions() every interval seconds in a daemon thread."""
+
+    def __init__(self, interval=SWEEP_INTERVAL):
+        self.interval = interval
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None or self.interval <= 0:
+                return
+            self._thread = threading.Thread(target=self._run, name='promotion-sweeper', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                expire_promotions()
+            except Exception:
+                logger.exception('Failed to expire promotions')
+            finally:
+                close_old_connections()
+
+
+sweeper = PeriodicSweeper()
+
+
+def _start_sweeper(**kwargs):
+    # Started by the first request rather than at import, so management
+    # commands never run it
+    sweeper.start()
+    request_started.disconnect(_start_sweeper)
+
+
+if SWEEP_INTERVAL > 0:
+    request_started.connect(_start_sweeper)
@@ -0,0 +1,125 @@
+"""
+Faceted counts for the browse page sidebar.
+
+One grouped query over the filtered listings returns a count per
+(category, condition, price bucket) combination. The category, condition and
+price facets are then summed up from those rows in Python. The category and
+condition facets each ignore their own selection so users can still see what
+switching to another value would give them. The price buckets count the
+listings within the min_price/max_price filters, which are part of the query.
+The rows are cached per normalized filter key.
+"""
+import hashlib
+import json
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, When, Value, IntegerField, Count
+
+FACET_CACHE_TIMEOUT = getattr(settings, 'FACET_CACHE_TIMEOUT', 120)
+
+# [min, max) in cedis, None means no upper bound. A price on a boundary
+# belongs to the bucket it starts.
+PRICE_BUCKETS = [
+    (0, 50),
+    (50, 200),
+    (200, 1000),
+    (1000, 5000),
+    (5000, None),
+]
+# Smallest price difference, Listing.price has two decimal places
+PRICE_STEP = Decimal('0.01')
+
+
+def _bucket_label(low, high):
+    if high is None:
+        return f'₵{low}+'
+    return f'₵{low} - ₵{high}'
+
+
+def facet_cache_key(filters):
+    """
+    Build a cache key from the filters that shape the grouped query.
+
+    Category and condition are applied after the query, so every selection
+    within the same search shares one cache entry.
+    """
+    normalized = {
+        'search': (filters.get('search') or '').strip().lower(),
+        'location': (filters.get('location') or '').strip().lower(),
+        'radius': filters.get('radius') or '',
+        'min_price': filters.get('min_price') or '',
+        'max_price': filters.get('max_price') or '',
+    }
+    digest = hashlib.md5(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+    return f'listing_facets:{digest}'
+
+
+def _price_bucket_case():
+    # Whens are evaluated in order, so each bucket only needs its upper bound
+    whens = [
+        When(price__lt=high, then=Value(index))
+        for index, (low, high) in enumerate(PRICE_BUCKETS)
+        if high is not None
+    ]
+    return Case(*whens, default=Value(len(PRICE_BUCKETS) - 1), output_field=IntegerField())
+
+
+def _facet_rows(queryset, filters):
+    key = facet_cache_key(filters)
+    rows = cache.get(key)
+    if rows is None:
+        rows = list(
+            queryset.annotate(price_bucket=_price_bucket_case())
+            .values('category_id', 'condition', 'price_bucket')
+            .annotate(total=Count('id'))
+            .order_by()
+        )
+        cache.set(key, rows, FACET_CACHE_TIMEOUT)
+    return rows
+
+
+class Facets:
+    def __init__(self, categories, conditions, price_buckets):
+        self.categories = categories
+        self.conditions = conditions
+        self.price_buckets = price_buckets
+
+
+def compute_facets(queryset, filters, category_ids=()):
+    """
+    Return Facets for queryset.
+
+    queryset must have every filter applied except category and condition,
+    which are read from filters and applied here. category_ids are the ids of
+    the categories named by filters['category'].
+    """
+    condition = filters.get('condition')
+    categories = defaultdict(int)
+    conditions = defaultdict(int)
+    buckets = defaultdict(int)
+
+    for row in _facet_rows(queryset, filters):
+        in_category = not filters.get('category') or row['category_id'] in category_ids
+        in_condition = not condition or row['condition'] == condition
+        if in_condition:
+            categories[row['category_id']] += row['total']
+        if in_category:
+            conditions[row['condition']] += row['total']
+        if in_category and in_condition:
+            buckets[row['price_bucket']] += row['total']
+
+    price_buckets = [
+        {
+            'min': low,
+            # The max_price filter is inclusive, stop one cent below the
+            # next bucket so a bucket link shows what the bucket counted
+            'max': None if high is None else Decimal(high) - PRICE_STEP,
+            'label': _bucket_label(low, high),
+            'count': buckets[index],
+        }
+        for index, (low, high) in enumerate(PRICE_BUCKETS)
+    ]
+    return Facets(dict(categories), dict(conditions), price_buckets)
@@ -0,0 +1,178 @@
+"""
+Structured listing locations.
+
+Free-text Listing.location values are matched against the gazetteer bundled
+in listings/data and stored as a place key, a region key and coordinates.
+Neighbourhoods such as East Legon name their town as parent in the
+gazetteer, so a search for the town also finds them. Browse filtering then
+uses an indexed lookup on place or region, or for "within N km" a bounding
+box range scan on (latitude, longitude) refined with the exact haversine
+distance.
+"""
+import csv
+import math
+import re
+from functools import lru_cache
+from pathlib import Path
+
+from django.db.models import F
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+DATA_DIR = Path(__file__).resolve().parent / 'data'
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE_LATITUDE = 111.045
+
+RADIUS_CHOICES = [5, 10, 25, 50, 100]
+
+
+class Place:
+    def __init__(self, key, name, region, latitude, longitude, aliases=(), parent=''):
+        self.key = key
+        self.name = name
+        self.region = region
+        self.parent = parent
+        self.latitude = latitude
+        self.longitude = longitude
+        self.aliases = list(aliases)
+
+    def __repr__(self):
+        return f'<Place {self.key}>'
+
+
+def normalize(text):
+    return ' '.join(re.findall(r'[a-z0-9]+', (text or '').lower()))
+
+
+class Gazetteer:
+    def __init__(self, places, regions):
+        self.places = {place.key: place for place in places}
+        self.regions = regions
+        self._children = {}
+        for place in places:
+            if place.parent:
+                self._children.setdefault(place.parent, []).append(place.key)
+        # Match longer names first so "east legon" wins over "legon"
+        self._place_names = sorted(
+            self._names(places), key=lambda item: len(item[0]), reverse=True
+        )
+        self._region_names = {}
+        for key, names in regions.items():
+            for name in names:
+                self._region_names[normalize(name)] = key
+
+    @staticmethod
+    def _names(places):
+        for place in places:
+            for name in [place.name] + place.aliases:
+                yield normalize(name), place
+
+    @classmethod
+    def load(cls, data_dir=DATA_DIR):
+        places = []
+        with open(data_dir / 'gazetteer.csv', newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                places.append(Place(
+                    row['place'], row['name'], row['region'],
+                    float(row['latitude']), float(row['longitude']),
+                    aliases=[alias for alias in row['aliases'].split('|') if alias],
+                    parent=row['parent'],
+                ))
+        regions = {}
+        with open(data_dir / 'regions.csv', newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                aliases = [alias for alias in row['aliases'].split('|') if alias]
+                regions[row['region']] = [row['name']] + aliases
+        return cls(places, regions)
+
+    def lookup(self, text):
+        """Return the most specific Place mentioned in text, or None."""
+        padded = f' {normalize(text)} '
+        for name, place in self._place_names:
+            if f' {name} ' in padded:
+                return place
+        return None
+
+    def place_keys(self, key):
+        """key and the keys of every place within it."""
+        keys = [key]
+        for key in keys:
+            keys.extend(self._children.get(key, ()))
+        return keys
+
+    def lookup_region(self, text):
+        """Return the region key if text names a region, or None."""
+        return self._region_names.get(normalize(text))
+
+
+@lru_cache(maxsize=1)
+def get_gazetteer():
+    return Gazetteer.load()
+
+
+def geocode(listing):
+    """Fill the structured location fields of listing from listing.location."""
+    place = get_gazetteer().lookup(listing.location)
+    if place is None:
+        listing.place = ''
+        listing.region = ''
+        listing.latitude = None
+        listing.longitude = None
+    else:
+        listing.place = place.key
+        listing.region = place.region
+        listing.latitude = place.latitude
+        listing.longitude = place.longitude
+    return place
+
+
+def bounding_box(latitude, longitude, radius_km):
+    lat_delta = radius_km / KM_PER_DEGREE_LATITUDE
+    # Clamp near the poles where a degree of longitude shrinks to nothing
+    lng_delta = radius_km / (KM_PER_DEGREE_LATITUDE * max(math.cos(math.radians(latitude)), 0.01))
+    return (
+        (latitude - lat_delta, latitude + lat_delta),
+        (longitude - lng_delta, longitude + lng_delta),
+    )
+
+
+def distance_expression(latitude, longitude):
+    """Haversine distance in km from (latitude, longitude) to each row."""
+    lat1, lng1 = math.radians(latitude), math.radians(longitude)
+    lat2, lng2 = Radians(F('latitude')), Radians(F('longitude'))
+    a = (
+        Power(Sin((lat2 - lat1) / 2), 2) +
+        math.cos(lat1) * Cos(lat2) * Power(Sin((lng2 - lng1) / 2), 2)
+    )
+    return 2 * EARTH_RADIUS_KM * ASin(Sqrt(a))
+
+
+def within_radius(queryset, latitude, longitude, radius_km):
+    (min_lat, max_lat), (min_lng, max_lng) = bounding_box(latitude, longitude, radius_km)
+    return queryset.filter(
+        latitude__range=(min_lat, max_lat),
+        longitude__range=(min_lng, max_lng),
+    ).annotate(
+        distance_km=distance_expression(latitude, longitude)
+    ).filter(distance_km__lte=radius_km)
+
+
+def filter_by_location(queryset, text, radius_km=None):
+    """
+    Filter listings by a location typed by the user.
+
+    Region names match on the region key, known places on the keys of the
+    place and the places within it (or on distance when radius_km is given)
+    and anything else falls back to a substring match on the raw location.
+    """
+    gazetteer = get_gazetteer()
+    # A region name such as "Greater Accra" must not be read as its capital
+    region = gazetteer.lookup_region(text)
+    if region is not None:
+        return queryset.filter(region=region)
+    place = gazetteer.lookup(text)
+    if place is not None:
+        if radius_km:
+            return within_radius(queryset, place.latitude, place.longitude, radius_km)
+        return queryset.filter(place__in=gazetteer.place_keys(place.key))
+    return queryset.filter(location__icontains=text)
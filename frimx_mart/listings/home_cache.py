@@ -0,0 +1,69 @@
+"""
+Versioned fragment cache for the home page.
+
+Each home page section is wrapped in a {% cache %} block keyed on a version
+number stored in the cache. Listing and Category signal handlers bump only the
+versions of the sections a change can affect, so the other sections stay
+cached. Old fragments are never deleted, they just stop being looked up and
+expire on their own.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+HOME_CACHE_TIMEOUT = getattr(settings, 'HOME_CACHE_TIMEOUT', 300)
+
+FEATURED = 'featured'
+RECENT = 'recent'
+BOOSTED = 'boosted'
+CATEGORIES = 'categories'
+HOME_SECTIONS = (FEATURED, RECENT, BOOSTED, CATEGORIES)
+
+
+def _version_key(section):
+    return f'home_section_version:{section}'
+
+
+def _fresh_version():
+    # Time based, so a version that was evicted from the cache is never reused
+    return int(time.time() * 1000)
+
+
+def get_section_versions():
+    """Return {section: version} for all home sections in one cache round trip."""
+    keys = {_version_key(section): section for section in HOME_SECTIONS}
+    found = cache.get_many(list(keys))
+    missing = {key: _fresh_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return {section: found[key] for key, section in keys.items()}
+
+
+def bump_sections(*sections):
+    for section in set(sections):
+        key = _version_key(section)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _fresh_version(), None)
+
+
+def sections_for_listing_change(old_values, new_values):
+    """Return the home sections a listing change can show up in."""
+    if old_values and new_values and all(
+        old_values.get(key) == value for key, value in new_values.items()
+    ):
+        # Counter-only saves (views, saves) do not change what the cards show
+        return []
+    states = [values for values in (old_values, new_values) if values]
+    visible = [v for v in states if v.get('is_active') and not v.get('is_sold')]
+    if not visible:
+        return []
+    sections = [RECENT]
+    if any(v.get('is_featured') for v in visible):
+        sections.append(FEATURED)
+    if any(v.get('is_boosted') for v in visible):
+        sections.append(BOOSTED)
+    return sections
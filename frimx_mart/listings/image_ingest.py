@@ -0,0 +1,95 @@
+"""
+Batched ingestion of listing image uploads.
+
+Uploads are checked from their headers only: Pillow's Image.open() reads the
+format and dimensions without decoding pixel data, which is enough to reject
+non-images, unsupported formats and oversized photos. Accepted files are
+streamed to storage chunk by chunk, all rows are inserted with a single
+bulk_create() with the primary image chosen up front, and resizing is left
+to the image variant workers.
+"""
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from PIL import Image, UnidentifiedImageError
+
+from . import home_cache
+from .image_variants import schedule_variants
+from .models import Listing, ListingImage
+from .storage import add_references
+
+MAX_LISTING_IMAGES = 8
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF'}
+
+MAX_IMAGE_BYTES = getattr(settings, 'LISTING_IMAGE_MAX_BYTES', 10 * 1024 * 1024)
+MAX_IMAGE_PIXELS = getattr(settings, 'LISTING_IMAGE_MAX_PIXELS', 40_000_000)
+
+
+def inspect_upload(uploaded):
+    """Return (format, width, height) of an upload, reading only its header."""
+    if uploaded.size > MAX_IMAGE_BYTES:
+        raise ValidationError(
+            f'{uploaded.name} is larger than {MAX_IMAGE_BYTES // (1024 * 1024)} MB.'
+        )
+    try:
+        uploaded.seek(0)
+        with Image.open(uploaded) as image:
+            fmt, (width, height) = image.format, image.size
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        raise ValidationError(f'{uploaded.name} is not a valid image.')
+    finally:
+        uploaded.seek(0)
+
+    if fmt not in ALLOWED_FORMATS:
+        raise ValidationError(f'{uploaded.name}: {fmt} images are not supported.')
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ValidationError(f'{uploaded.name} is too large ({width}x{height} pixels).')
+    return fmt, width, height
+
+
+def validate_listing_images(uploads):
+    """Check every upload, raising one ValidationError listing all problems."""
+    if len(uploads) > MAX_LISTING_IMAGES:
+        raise ValidationError(f'You can upload at most {MAX_LISTING_IMAGES} images.')
+    errors = []
+    for uploaded in uploads:
+        try:
+            inspect_upload(uploaded)
+        except ValidationError as e:
+            errors.extend(e.messages)
+    if errors:
+        raise ValidationError(errors)
+
+
+def ingest_listing_images(listing, uploads, primary_index=0):
+    """
+    Store validated uploads for listing and return the created ListingImages.
+
+    uploads[primary_index] becomes the primary image, pass primary_index=None
+    when adding images to a listing that already has one.
+    """
+    if not uploads:
+        return []
+
+    images = []
+    for i, uploaded in enumerate(uploads):
+        image = ListingImage(listing=listing, is_primary=(i == primary_index))
+        # FieldFile.save() writes the upload to storage in chunks
+        image.image.save(uploaded.name, uploaded, save=False)
+        images.append(image)
+
+    with transaction.atomic():
+        ListingImage.objects.bulk_create(images)
+        primary = next((image for image in images if image.is_primary), None)
+        if primary is not None:
+            Listing.objects.filter(pk=listing.pk).update(primary_image=primary)
+            listing.primary_image = primary
+        else:
+            Listing.objects.filter(pk=listing.pk, primary_image__isnull=True).update(
+                primary_image=images[0]
+            )
+        # bulk_create() skips the ListingImage signals, do their work once
+        add_references([image.image.name for image in images])
+        schedule_variants(*[image.pk for image in images])
+        home_cache.bump_sections(home_cache.FEATURED, home_cache.RECENT, home_cache.BOOSTED)
+    return images
@@ -0,0 +1,168 @@
+"""
+Resized derivatives of listing images.
+
+Every ListingImage gets a WebP and a JPEG rendition for each size in
+IMAGE_VARIANT_SIZES, stored next to the original under
+listing_images/variants/. The generated names are recorded on
+ListingImage.variants so templates can pick a size without touching storage,
+and fall back to the original until the variants exist.
+
+Variants are generated by a small thread pool once the upload is committed
+(IMAGE_VARIANT_WORKERS, 0 generates them inline), and the
+generate_image_variants command backfills older images.
+"""
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, features
+
+from . import home_cache
+
+logger = logging.getLogger(__name__)
+
+# name: longest edge in pixels, about twice the largest CSS size it is shown at
+IMAGE_VARIANT_SIZES = {
+    'thumb': 240,
+    'card': 480,
+    'large': 1280,
+}
+
+JPEG_QUALITY = 80
+WEBP_QUALITY = 75
+VARIANT_DIR = 'listing_images/variants'
+
+WORKERS = getattr(settings, 'IMAGE_VARIANT_WORKERS', 2)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_name(original_name, size, fmt):
+    stem = posixpath.splitext(posixpath.basename(original_name))[0]
+    extension = 'webp' if fmt == 'webp' else 'jpg'
+    return f'{VARIANT_DIR}/{stem}_{size}.{extension}'
+
+
+def _encode(image, fmt):
+    buffer = BytesIO()
+    if fmt == 'webp':
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    else:
+        if image.mode != 'RGB':
+            # JPEG has no alpha channel, flatten onto white
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+            image = background
+        image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def generate_variants(listing_image, bump_cache=True, reuse=True):
+    """Render, store and record every variant of listing_image, return them."""
+    model = type(listing_image)
+    if reuse:
+        # Deduplicated uploads share a file, and so the variants rendered for
+        # another image with the same file
+        variants = model.objects.filter(image=listing_image.image.name).exclude(
+            pk=listing_image.pk
+        ).exclude(variants={}).values_list('variants', flat=True).first()
+        if variants:
+            model.objects.filter(pk=listing_image.pk).update(variants=variants)
+            listing_image.variants = variants
+            return variants
+
+    # Variants are derived files, they are not deduplicated with the originals
+    storage = default_storage
+    formats = ['webp', 'jpeg'] if features.check('webp') else ['jpeg']
+
+    with listing_image.image.open('rb') as f:
+        source = Image.open(f)
+        # Phone photos are usually stored sideways with an EXIF rotation
+        source = ImageOps.exif_transpose(source)
+        if source.mode not in ('RGB', 'RGBA'):
+            source = source.convert('RGBA' if 'transparency' in source.info else 'RGB')
+        source.load()
+
+    variants = {}
+    for size, edge in IMAGE_VARIANT_SIZES.items():
+        resized = source.copy()
+        # Never upscale, a small original is served as a recompressed copy
+        resized.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        variants[size] = {'width': resized.width, 'height': resized.height}
+        for fmt in formats:
+            name = variant_name(listing_image.image.name, size, fmt)
+            if storage.exists(name):
+                if reuse:
+                    variants[size][fmt] = name
+                    continue
+                storage.delete(name)
+            saved = storage.save(name, ContentFile(_encode(resized, fmt)))
+            if saved != name:
+                # Another worker rendered the same shared file meanwhile
+                storage.delete(saved)
+            variants[size][fmt] = name
+
+    model.objects.filter(pk=listing_image.pk).update(variants=variants)
+    listing_image.variants = variants
+    if bump_cache:
+        # Cached home page cards still point at the original
+        home_cache.bump_sections(home_cache.FEATURED, home_cache.RECENT, home_cache.BOOSTED)
+    return variants
+
+
+def _generate(image_ids):
+    from .models import ListingImage
+
+    generated = 0
+    for listing_image in ListingImage.objects.filter(pk__in=image_ids):
+        try:
+            generate_variants(listing_image, bump_cache=False)
+        except Exception:
+            # Templates keep serving the original, the backfill command retries
+            logger.exception('Failed to generate variants for listing image %s', listing_image.pk)
+        else:
+            generated += 1
+    if generated:
+        # Cached home page cards still point at the originals
+        home_cache.bump_sections(home_cache.FEATURED, home_cache.RECENT, home_cache.BOOSTED)
+
+
+def _generate_in_worker(image_ids):
+    close_old_connections()
+    try:
+        _generate(image_ids)
+    finally:
+        close_old_connections()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='image-variants')
+        return _executor
+
+
+def schedule_variants(*image_ids):
+    """Generate variants for image_ids once the current transaction commits."""
+    if not image_ids:
+        return
+    if WORKERS <= 0:
+        transaction.on_commit(lambda: _generate(image_ids))
+    else:
+        transaction.on_commit(lambda: _get_executor().submit(_generate_in_worker, image_ids))
+
+
+def variant_url(listing_image, size, fmt='jpeg'):
+    """URL of a variant, or of the original while it has not been generated."""
+    name = (listing_image.variants or {}).get(size, {}).get(fmt)
+    if name:
+        return default_storage.url(name)
+    return listing_image.image.url
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from listings.similarity import build_similar_listings, stale_listing_ids, TOP_N
+
+class Command(BaseCommand):
+    help = 'Precompute similar listings (TF-IDF text similarity, category and price proximity)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Recompute neighbours for every active listing instead of only those affected by changes',
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=TOP_N,
+            help=f'Number of neighbours to store per listing (default {TOP_N})',
+        )
+
+    def handle(self, *args, **options):
+        if options['full']:
+            count = build_similar_listings(top_n=options['top'])
+        else:
+            listing_ids = stale_listing_ids()
+            if not listing_ids:
+                self.stdout.write(self.style.SUCCESS('Similar listings are up to date.'))
+                return
+            count = build_similar_listings(listing_ids, top_n=options['top'])
+
+        self.stdout.write(self.style.SUCCESS(f'Updated similar listings for {count} listings.'))
@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from listings.storage import collect_orphaned_blobs, recount_references
+
+class Command(BaseCommand):
+    help = 'Delete deduplicated media blobs that no listing image or chat message uses any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours',
+            type=int,
+            default=24,
+            help='Keep unreferenced blobs uploaded in the last N hours (default 24)',
+        )
+        parser.add_argument(
+            '--recount',
+            action='store_true',
+            help='Recount references from the database before collecting',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report what would be deleted',
+        )
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            drifted = recount_references()
+            self.stdout.write(f'Fixed reference counts of {len(drifted)} blobs.')
+
+        older_than = timezone.now() - timedelta(hours=options['grace_hours'])
+        blobs = collect_orphaned_blobs(older_than, dry_run=options['dry_run'])
+        size = sum(blob.size for blob in blobs)
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {len(blobs)} orphaned blobs ({size / (1024 * 1024):.1f} MB).'
+        ))
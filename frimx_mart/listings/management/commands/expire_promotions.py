@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from listings.expiry import expire_promotions
+
+class Command(BaseCommand):
+    help = 'Clear boosts, promotions and promoted features whose end date has passed'
+
+    def handle(self, *args, **options):
+        expired = expire_promotions()
+        self.stdout.write(self.style.SUCCESS(
+            f"Expired {expired['boosts']} boosts, {expired['promotions']} promotions "
+            f"and {expired['features']} featured listings."
+        ))
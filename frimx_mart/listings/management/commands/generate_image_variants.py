@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from listings import home_cache
+from listings.image_variants import generate_variants
+from listings.models import ListingImage
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP/JPEG variants for listing images that have none'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate variants for every image, e.g. after changing the sizes',
+        )
+
+    def handle(self, *args, **options):
+        images = ListingImage.objects.order_by('id')
+        if not options['force']:
+            images = images.filter(variants={})
+
+        generated = failed = 0
+        for listing_image in images.iterator(chunk_size=100):
+            try:
+                generate_variants(listing_image, bump_cache=False, reuse=not options['force'])
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f'Image {listing_image.pk} ({listing_image.image.name}): {e}')
+            else:
+                generated += 1
+
+        if generated:
+            home_cache.bump_sections(home_cache.FEATURED, home_cache.RECENT, home_cache.BOOSTED)
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated variants for {generated} images ({failed} failed).'
+        ))
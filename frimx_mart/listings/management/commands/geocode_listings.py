@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from listings.geo import geocode
+from listings.models import Listing
+
+class Command(BaseCommand):
+    help = 'Match listing locations against the bundled gazetteer and store coordinates'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Re-geocode every listing instead of only those without a place',
+        )
+
+    def handle(self, *args, **options):
+        listings = Listing.objects.only('id', 'location', 'place', 'region', 'latitude', 'longitude')
+        if not options['all']:
+            listings = listings.filter(place='')
+
+        fields = ['place', 'region', 'latitude', 'longitude']
+        batch = []
+        matched = total = 0
+        for listing in listings.iterator(chunk_size=1000):
+            total += 1
+            if geocode(listing) is not None:
+                matched += 1
+            batch.append(listing)
+            if len(batch) >= 1000:
+                Listing.objects.bulk_update(batch, fields)
+                batch = []
+        if batch:
+            Listing.objects.bulk_update(batch, fields)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Geocoded {matched} of {total} listings ({total - matched} unknown locations).'
+        ))
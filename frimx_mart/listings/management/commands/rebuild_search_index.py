@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from listings.search import get_backend, BasicSearchBackend
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for listings'
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        if isinstance(backend, BasicSearchBackend):
+            self.stdout.write(self.style.WARNING(
+                'No full-text search index available for this database, nothing to rebuild.'
+            ))
+            return
+
+        with transaction.atomic():
+            count = backend.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} listings.'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from listings.counters import reconcile_category_counts
+
+class Command(BaseCommand):
+    help = 'Recount active listings per category and fix any drift in the stored counts'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drifted = reconcile_category_counts()
+
+        for category in drifted:
+            self.stdout.write(self.style.WARNING(
+                f'Fixed {category.name}: {category.active_listing_count} active listings'
+            ))
+        self.stdout.write(self.style.SUCCESS(f'Reconciled {len(drifted)} categories.'))
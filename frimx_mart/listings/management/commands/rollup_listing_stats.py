@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from listings.activity import rollup_listing_stats
+
+class Command(BaseCommand):
+    help = 'Recount the daily saves and chat starts of listings shown on seller dashboards'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=30,
+            help='Number of days to recount, ending today (default 30)',
+        )
+
+    def handle(self, *args, **options):
+        written = rollup_listing_stats(max(options['days'], 1))
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {written} listing days.'))
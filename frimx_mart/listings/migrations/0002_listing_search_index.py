@@ -0,0 +1,57 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                "CREATE VIRTUAL TABLE listings_listing_fts USING fts5("
+                "listing_id UNINDEXED, title, description, category, "
+                "tokenize = 'porter unicode61')"
+            )
+        except Exception:
+            # SQLite built without FTS5, search falls back to icontains
+            return
+        schema_editor.execute(
+            "INSERT INTO listings_listing_fts (listing_id, title, description, category) "
+            "SELECT l.id, l.title, l.description, COALESCE(c.name, '') "
+            "FROM listings_listing l LEFT JOIN listings_category c ON c.id = l.category_id"
+        )
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE listings_listing_search ("
+            "listing_id uuid PRIMARY KEY REFERENCES listings_listing (id) ON DELETE CASCADE, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX listings_listing_search_document_gin "
+            "ON listings_listing_search USING GIN (document)"
+        )
+        schema_editor.execute(
+            "INSERT INTO listings_listing_search (listing_id, document) "
+            "SELECT l.id, "
+            "setweight(to_tsvector('english', coalesce(l.title, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(c.name, '')), 'B') || "
+            "setweight(to_tsvector('english', coalesce(l.description, '')), 'C') "
+            "FROM listings_listing l LEFT JOIN listings_category c ON c.id = l.category_id"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS listings_listing_fts")
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute("DROP TABLE IF EXISTS listings_listing_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("listings", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.10 on 2026-10-18 08:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0002_listing_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['is_active', 'is_sold', '-created_at', '-id'], name='listing_browse_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['is_active', 'is_sold', 'price', 'id'], name='listing_browse_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['is_active', 'is_sold', '-views', '-id'], name='listing_browse_views_idx'),
+        ),
+    ]
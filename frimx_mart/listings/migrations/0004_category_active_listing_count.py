@@ -0,0 +1,30 @@
+# Generated by Django 5.2.10 on 2026-10-18 08:17
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_counts(apps, schema_editor):
+    Category = apps.get_model('listings', 'Category')
+    categories = list(Category.objects.annotate(
+        total=Count('listing', filter=Q(listing__is_active=True, listing__is_sold=False))
+    ))
+    for category in categories:
+        category.active_listing_count = category.total
+    Category.objects.bulk_update(categories, ['active_listing_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0003_listing_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='active_listing_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.10 on 2026-10-18 08:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0004_category_active_listing_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarListing',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('computed_at', models.DateTimeField()),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_links', to='listings.listing')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_to_links', to='listings.listing')),
+            ],
+            options={
+                'ordering': ['-score'],
+                'unique_together': {('listing', 'similar')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.10 on 2026-10-18 08:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_primary_images(apps, schema_editor):
+    Listing = apps.get_model('listings', 'Listing')
+    ListingImage = apps.get_model('listings', 'ListingImage')
+    first_image = ListingImage.objects.filter(
+        listing=OuterRef('pk')
+    ).order_by('-is_primary', 'uploaded_at', 'id').values('id')[:1]
+    Listing.objects.update(primary_image=Subquery(first_image))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0005_similarlisting'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='primary_image',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='listings.listingimage'),
+        ),
+        migrations.RunPython(backfill_primary_images, migrations.RunPython.noop),
+    ]
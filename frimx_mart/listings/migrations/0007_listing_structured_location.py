@@ -0,0 +1,39 @@
+# Generated by Django 5.2.10 on 2026-10-18 08:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0006_listing_primary_image'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='place',
+            field=models.CharField(blank=True, db_index=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='region',
+            field=models.CharField(blank=True, db_index=True, max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['latitude', 'longitude'], name='listing_coordinates_idx'),
+        ),
+    ]
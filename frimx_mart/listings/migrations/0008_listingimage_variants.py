@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-18 08:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0007_listing_structured_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listingimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
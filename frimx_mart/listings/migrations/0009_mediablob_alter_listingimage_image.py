@@ -0,0 +1,31 @@
+# Generated by Django 5.2.10 on 2026-10-18 08:28
+
+import django.utils.timezone
+import listings.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0008_listingimage_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('sha256', models.CharField(db_index=True, max_length=64)),
+                ('size', models.PositiveBigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('uploaded_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='listingimage',
+            name='image',
+            field=models.ImageField(storage=listings.storage.get_blob_storage, upload_to='listing_images/'),
+        ),
+    ]
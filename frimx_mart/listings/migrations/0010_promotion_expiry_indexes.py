@@ -0,0 +1,27 @@
+# Generated by Django 5.2.10 on 2026-10-18 08:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0009_mediablob_alter_listingimage_image'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('is_boosted', True)), fields=['boosted_until'], name='listing_boost_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_featured', True), ('is_sold', False)), fields=['-created_at'], name='listing_featured_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promotion',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['end_date'], name='promotion_expiry_idx'),
+        ),
+    ]
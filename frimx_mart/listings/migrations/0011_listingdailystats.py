@@ -0,0 +1,32 @@
+# Generated by Django 5.2.10 on 2026-10-18 08:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0010_promotion_expiry_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('saves', models.PositiveIntegerField(default=0)),
+                ('chat_starts', models.PositiveIntegerField(default=0)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='listings.listing')),
+                ('seller', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['seller', 'date'], name='listing_stats_seller_idx')],
+                'constraints': [models.UniqueConstraint(fields=('listing', 'date'), name='listing_daily_stats_uniq')],
+            },
+        ),
+    ]
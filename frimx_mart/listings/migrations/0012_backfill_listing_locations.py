@@ -0,0 +1,32 @@
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def backfill_locations(apps, schema_editor):
+    from listings.geo import geocode
+
+    Listing = apps.get_model('listings', 'Listing')
+    fields = ['place', 'region', 'latitude', 'longitude']
+    batch = []
+    listings = Listing.objects.filter(place='').exclude(location='').only('id', 'location', *fields)
+    for listing in listings.iterator(chunk_size=BATCH_SIZE):
+        if geocode(listing) is None:
+            continue
+        batch.append(listing)
+        if len(batch) >= BATCH_SIZE:
+            Listing.objects.bulk_update(batch, fields)
+            batch = []
+    if batch:
+        Listing.objects.bulk_update(batch, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0011_listingdailystats'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_locations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.10 on 2026-10-18 09:02
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+
+def set_similar_computed_at(apps, schema_editor):
+    # Listings with stored neighbours are up to date as of their last run
+    Listing = apps.get_model('listings', 'Listing')
+    SimilarListing = apps.get_model('listings', 'SimilarListing')
+    last_computed = SimilarListing.objects.filter(
+        listing=OuterRef('pk')
+    ).values('listing').annotate(last=Max('computed_at')).values('last')
+    Listing.objects.update(similar_computed_at=Subquery(last_computed))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0012_backfill_listing_locations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='similar_computed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(set_similar_computed_at, migrations.RunPython.noop),
+    ]
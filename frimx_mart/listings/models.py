@@ -1,8 +1,11 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 import uuid
 
+from .storage import get_blob_storage
+
 User = get_user_model()
 
 CATEGORY_CHOICES = [
@@ -31,13 +34,26 @@ class Category(models.Model):
     icon = models.CharField(max_length=20, default='📦')
     description = models.TextField(blank=True)
     parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE)
+    # Active, unsold listings in this category, maintained by listings.signals
+    # and repaired by the reconcile_category_counts command
+    active_listing_count = models.PositiveIntegerField(default=0)
     
     def __str__(self):
         return self.name
     
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Never write back a possibly stale counter, it is only changed
+            # through F() updates in listings.counters
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'active_listing_count'
+            ]
+        super().save(*args, **kwargs)
+    
     @property
     def listing_count(self):
-        return self.listing_set.filter(is_active=True).count()
+        return self.active_listing_count
 
 class Listing(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -49,6 +65,17 @@ class Listing(models.Model):
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True)
     condition = models.CharField(max_length=20, choices=CONDITION_CHOICES, default='used_good')
     location = models.CharField(max_length=200)
+    # Structured location matched from `location` against the bundled
+    # gazetteer, see listings/geo.py. Empty/NULL when the place is unknown.
+    place = models.CharField(max_length=50, blank=True, db_index=True)
+    region = models.CharField(max_length=50, blank=True, db_index=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    # Image shown on listing cards, kept in sync by ListingImage.save() and
+    # the ListingImage post_delete handler so cards can select_related() it
+    primary_image = models.ForeignKey(
+        'ListingImage', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
     
     # Status flags
     is_active = models.BooleanField(default=True)
@@ -60,8 +87,11 @@ class Listing(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     boosted_until = models.DateTimeField(null=True, blank=True)
+    # When the similar listings were last computed, see listings/similarity.py
+    similar_computed_at = models.DateTimeField(null=True, blank=True, editable=False)
     
-    # Counters
+    # Counters, only changed through F() updates: views by the flush in
+    # listings/activity.py, saves by the save_listing view
     views = models.IntegerField(default=0)
     saves = models.IntegerField(default=0)
     
@@ -71,28 +101,124 @@ class Listing(models.Model):
             models.Index(fields=['is_active', 'is_sold']),
             models.Index(fields=['category', 'is_active']),
             models.Index(fields=['price']),
+            # Keyset pagination on the browse page, one per supported sort
+            models.Index(fields=['is_active', 'is_sold', '-created_at', '-id'], name='listing_browse_recent_idx'),
+            models.Index(fields=['is_active', 'is_sold', 'price', 'id'], name='listing_browse_price_idx'),
+            models.Index(fields=['is_active', 'is_sold', '-views', '-id'], name='listing_browse_views_idx'),
+            # Bounding box prefilter for radius searches
+            models.Index(fields=['latitude', 'longitude'], name='listing_coordinates_idx'),
+            # Boosted listings by expiry, for the home page and the sweeper in
+            # listings/expiry.py, and the featured listings of the home page
+            models.Index(fields=['boosted_until'], name='listing_boost_expiry_idx', condition=Q(is_boosted=True)),
+            models.Index(
+                fields=['-created_at'], name='listing_featured_idx',
+                condition=Q(is_featured=True, is_active=True, is_sold=False),
+            ),
         ]
     
     def __str__(self):
         return self.title
     
+    COUNTER_FIELDS = {'views', 'saves'}
+    
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Never write back possibly stale counters over increments made
+            # since the listing was loaded
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.COUNTER_FIELDS and f.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded state so signal handlers can tell what changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
     @property
     def is_boosted_active(self):
+        # is_boosted is cleared by listings/expiry.py, the date check covers
+        # the time until its next run
         if self.is_boosted and self.boosted_until:
             return self.boosted_until > timezone.now()
         return False
 
 class ListingImage(models.Model):
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='images')
-    image = models.ImageField(upload_to='listing_images/')
+    image = models.ImageField(upload_to='listing_images/', storage=get_blob_storage)
     is_primary = models.BooleanField(default=False)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # {size: {'width', 'height', 'webp', 'jpeg'}}, see listings/image_variants.py
+    variants = models.JSONField(default=dict, blank=True)
     
     def save(self, *args, **kwargs):
         if self.is_primary:
             # Ensure only one primary image per listing
             ListingImage.objects.filter(listing=self.listing, is_primary=True).update(is_primary=False)
         super().save(*args, **kwargs)
+        listings = Listing.objects.filter(pk=self.listing_id)
+        if self.is_primary:
+            listings.update(primary_image=self)
+            self.listing.primary_image = self
+        else:
+            # The first image of a listing without a primary one stands in
+            listings.filter(primary_image__isnull=True).update(primary_image=self)
+    
+    @classmethod
+    def promote_next(cls, listing_id):
+        """Point a listing that lost its primary image at its next image."""
+        next_image = cls.objects.filter(listing_id=listing_id).order_by(
+            '-is_primary', 'uploaded_at', 'id'
+        ).first()
+        if next_image is not None:
+            Listing.objects.filter(pk=listing_id, primary_image__isnull=True).update(
+                primary_image=next_image
+            )
+
+class MediaBlob(models.Model):
+    """A deduplicated uploaded file, see listings/storage.py"""
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    # Last time the content was uploaded, new or as a duplicate
+    uploaded_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    def __str__(self):
+        return self.name
+
+class SimilarListing(models.Model):
+    """Precomputed neighbour of a listing, see listings/similarity.py"""
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='similar_links')
+    similar = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='similar_to_links')
+    score = models.FloatField()
+    computed_at = models.DateTimeField()
+    
+    class Meta:
+        unique_together = ['listing', 'similar']
+        ordering = ['-score']
+
+class ListingDailyStats(models.Model):
+    """Views, saves and chat starts of a listing on one day, see listings/activity.py"""
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='daily_stats')
+    # Copied from the listing so a seller's stats are one index range
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', db_index=False)
+    date = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    saves = models.PositiveIntegerField(default=0)
+    chat_starts = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['listing', 'date'], name='listing_daily_stats_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['seller', 'date'], name='listing_stats_seller_idx'),
+        ]
 
 class SavedListing(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='saved_listings')
@@ -113,6 +239,22 @@ class Review(models.Model):
     
     class Meta:
         unique_together = ['seller', 'buyer', 'listing']
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
+    def save(self, *args, **kwargs):
+        # The seller rating aggregates are updated from post_save, keep both
+        # writes in one transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
 
 class Promotion(models.Model):
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE)
@@ -123,5 +265,11 @@ class Promotion(models.Model):
     cost = models.DecimalField(max_digits=10, decimal_places=2)
     start_date = models.DateTimeField()
     end_date = models.DateTimeField()
+    # Cleared by listings/expiry.py once end_date has passed
     is_active = models.BooleanField(default=True)
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['end_date'], name='promotion_expiry_idx', condition=Q(is_active=True)),
+        ]
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of COUNT(*) plus OFFSET, each page is fetched with a WHERE clause on
+the sort key of the last row seen, with the primary key as a tie-breaker, so
+page 500 costs the same as page 1. Cursors are opaque url-safe base64 tokens.
+"""
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+# Orderings supported by listing_list, as (field, descending) pairs. The
+# primary key is always appended as the tie-breaker.
+LISTING_ORDERINGS = {
+    '-created_at': ('created_at', True),
+    'recent': ('created_at', True),
+    'price_asc': ('price', False),
+    'price_desc': ('price', True),
+    'popular': ('views', True),
+    '-views': ('views', True),
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values, reverse=False):
+    payload = json.dumps({'v': values, 'r': reverse}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values, reverse = payload['v'], payload['r']
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor(cursor)
+    # A sort key and a primary key, see CursorPaginator._key()
+    if not isinstance(values, list) or len(values) != 2 or not isinstance(reverse, bool):
+        raise InvalidCursor(cursor)
+    return values, reverse
+
+
+def _serialize(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Paginate queryset ordered by field (plus the primary key).
+
+    The ordered field must not be nullable, otherwise rows with NULL would be
+    skipped by the keyset comparison.
+    """
+
+    def __init__(self, queryset, per_page, field, descending=False):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.field = field
+        self.descending = descending
+
+    def _to_python(self, name, value):
+        try:
+            return self.queryset.model._meta.get_field(name).to_python(value)
+        except FieldDoesNotExist:
+            # Annotations such as a search rank are stored as plain JSON values
+            return value
+
+    def _ordering(self, descending):
+        prefix = '-' if descending else ''
+        return [f'{prefix}{self.field}', f'{prefix}pk']
+
+    def _after(self, values, descending):
+        value = self._to_python(self.field, values[0])
+        pk = self._to_python('id', values[1])
+        op = 'lt' if descending else 'gt'
+        return Q(**{f'{self.field}__{op}': value}) | Q(**{self.field: value, f'pk__{op}': pk})
+
+    def _key(self, obj):
+        return [_serialize(getattr(obj, self.field)), _serialize(obj.pk)]
+
+    def get_page(self, cursor=None):
+        """Return a CursorPage, starting over from the first page on a bad cursor."""
+        values, reverse = None, False
+        if cursor:
+            try:
+                values, reverse = decode_cursor(cursor)
+            except InvalidCursor:
+                values, reverse = None, False
+
+        # Walking backwards flips the ordering, the page is reversed afterwards
+        descending = self.descending != reverse
+        queryset = self.queryset.order_by(*self._ordering(descending))
+        if values:
+            try:
+                queryset = queryset.filter(self._after(values, descending))
+            except (ValidationError, ValueError, KeyError, IndexError, TypeError):
+                queryset = self.queryset.order_by(*self._ordering(self.descending))
+                values, reverse = None, False
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or reverse:
+                next_cursor = encode_cursor(self._key(rows[-1]))
+            if values and (has_more or not reverse):
+                previous_cursor = encode_cursor(self._key(rows[0]), reverse=True)
+        return CursorPage(rows, next_cursor, previous_cursor)
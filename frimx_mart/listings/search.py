@@ -0,0 +1,233 @@
+"""
+Full-text search for listings.
+
+SQLite uses an FTS5 virtual table and PostgreSQL a tsvector side table with a
+GIN index. Both are keyed by listing id and kept in sync by the signal
+handlers in listings/signals.py. Other databases fall back to icontains.
+
+The match is part of the listing query itself, so the visibility, category,
+location and price filters of the caller apply to every matching listing,
+along with a rank expression the caller can sort and paginate on. On SQLite
+the FTS5 table is joined to the listing query, so the MATCH runs once and
+bm25() is read from the joined row. On PostgreSQL the match is a subquery
+and the rank a primary key lookup in the side table.
+"""
+import re
+
+from django.db import connection
+from django.db.models import F, FloatField, Func, Q
+from django.db.models.expressions import RawSQL
+
+SQLITE_TABLE = 'listings_listing_fts'
+POSTGRES_TABLE = 'listings_listing_search'
+
+
+def tokenize(query):
+    """Split user input into safe search terms."""
+    return re.findall(r'\w+', query.lower())[:10]
+
+
+class SearchRank(Func):
+    """
+    Rank of the listing against a full-text query, higher is better. sql is
+    a scalar subquery with {listing_id} standing for the listing's id column
+    and params for its placeholders before it.
+    """
+    output_field = FloatField()
+
+    def __init__(self, sql, params):
+        super().__init__(F('pk'))
+        self.sql = sql
+        self.params = params
+
+    def as_sql(self, compiler, connection, **extra_context):
+        id_sql, id_params = compiler.compile(self.source_expressions[0])
+        return self.sql.format(listing_id=id_sql), [*self.params, *id_params]
+
+
+class BaseSearchBackend:
+    def is_available(self):
+        return True
+
+    def filter(self, queryset, query):
+        """
+        Return queryset restricted to listings matching query and a rank
+        expression to annotate them with, or None when the backend does not
+        rank.
+        """
+        raise NotImplementedError
+
+    def index_listing(self, listing):
+        pass
+
+    def remove_listing(self, listing_id):
+        pass
+
+    def reindex_category(self, category_id):
+        pass
+
+    def rebuild(self):
+        return 0
+
+
+class BasicSearchBackend(BaseSearchBackend):
+    """Fallback for databases without a full-text engine."""
+
+    def filter(self, queryset, query):
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(description__icontains=query) |
+            Q(category__name__icontains=query)
+        ), None
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    # Databases the FTS table was found in. It is never dropped once created,
+    # a missing table is looked up again in case a migration adds it.
+    available_in = set()
+
+    def is_available(self):
+        name = connection.settings_dict['NAME']
+        if name not in self.available_in:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT name FROM sqlite_master WHERE type='table' AND name=%s",
+                    [SQLITE_TABLE]
+                )
+                if cursor.fetchone() is None:
+                    return False
+            self.available_in.add(name)
+        return True
+
+    def build_query(self, query):
+        return ' '.join(f'"{term}"*' for term in tokenize(query))
+
+    def filter(self, queryset, query):
+        match = self.build_query(query)
+        if not match:
+            return queryset.none(), None
+        listing_table = queryset.model._meta.db_table
+        # Each listing has one row in the FTS table, so the join never
+        # repeats a listing
+        queryset = queryset.extra(
+            tables=[SQLITE_TABLE],
+            where=[f"{SQLITE_TABLE}.listing_id = {listing_table}.id", f"{SQLITE_TABLE} MATCH %s"],
+            params=[match],
+        )
+        # bm25() is lower-is-better, flip it so higher rank means better
+        rank = RawSQL(f"-bm25({SQLITE_TABLE}, 0, 10.0, 1.0, 5.0)", [], output_field=FloatField())
+        return queryset, rank
+
+    def index_listing(self, listing):
+        category_name = listing.category.name if listing.category_id else ''
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SQLITE_TABLE} WHERE listing_id = %s", [listing.id.hex])
+            cursor.execute(
+                f"INSERT INTO {SQLITE_TABLE} (listing_id, title, description, category) "
+                f"VALUES (%s, %s, %s, %s)",
+                [listing.id.hex, listing.title, listing.description, category_name]
+            )
+
+    def remove_listing(self, listing_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SQLITE_TABLE} WHERE listing_id = %s", [listing_id.hex])
+
+    def reindex_category(self, category_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {SQLITE_TABLE} SET category = "
+                f"(SELECT name FROM listings_category WHERE id = %s) "
+                f"WHERE listing_id IN (SELECT id FROM listings_listing WHERE category_id = %s)",
+                [category_id, category_id]
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SQLITE_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {SQLITE_TABLE} (listing_id, title, description, category) "
+                f"SELECT l.id, l.title, l.description, COALESCE(c.name, '') "
+                f"FROM listings_listing l LEFT JOIN listings_category c ON c.id = l.category_id"
+            )
+            return cursor.rowcount
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    # Title matches outweigh category matches, which outweigh the description
+    document_sql = (
+        "setweight(to_tsvector('english', coalesce(%s, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(%s, '')), 'B') || "
+        "setweight(to_tsvector('english', coalesce(%s, '')), 'C')"
+    )
+
+    def build_query(self, query):
+        return ' & '.join(f'{term}:*' for term in tokenize(query))
+
+    def filter(self, queryset, query):
+        tsquery = self.build_query(query)
+        if not tsquery:
+            return queryset.none(), None
+        matching = RawSQL(
+            f"SELECT listing_id FROM {POSTGRES_TABLE} WHERE document @@ to_tsquery('english', %s)",
+            [tsquery]
+        )
+        rank = SearchRank(
+            f"(SELECT ts_rank(document, to_tsquery('english', %s)) FROM {POSTGRES_TABLE} "
+            f"WHERE listing_id = {{listing_id}})",
+            [tsquery]
+        )
+        return queryset.filter(id__in=matching), rank
+
+    def index_listing(self, listing):
+        category_name = listing.category.name if listing.category_id else ''
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {POSTGRES_TABLE} (listing_id, document) "
+                f"VALUES (%s, {self.document_sql}) "
+                f"ON CONFLICT (listing_id) DO UPDATE SET document = EXCLUDED.document",
+                [listing.id, listing.title, category_name, listing.description]
+            )
+
+    def remove_listing(self, listing_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {POSTGRES_TABLE} WHERE listing_id = %s", [listing_id])
+
+    def reindex_category(self, category_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {POSTGRES_TABLE} s SET document = "
+                f"{self.document_sql % ('l.title', 'c.name', 'l.description')} "
+                f"FROM listings_listing l JOIN listings_category c ON c.id = l.category_id "
+                f"WHERE s.listing_id = l.id AND c.id = %s",
+                [category_id]
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {POSTGRES_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {POSTGRES_TABLE} (listing_id, document) "
+                f"SELECT l.id, {self.document_sql % ('l.title', 'c.name', 'l.description')} "
+                f"FROM listings_listing l LEFT JOIN listings_category c ON c.id = l.category_id"
+            )
+            return cursor.rowcount
+
+
+def get_backend():
+    if connection.vendor == 'sqlite':
+        backend = SQLiteSearchBackend()
+        if backend.is_available():
+            return backend
+    elif connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return BasicSearchBackend()
+
+
+def search_listings(queryset, query):
+    """
+    Restrict queryset to listings matching query.
+
+    Returns the filtered queryset and the rank expression to annotate it
+    with, which is None when the fallback backend is in use.
+    """
+    return get_backend().filter(queryset, query)
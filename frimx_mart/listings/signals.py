@@ -0,0 +1,137 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from dashboard.stats import record_listing_change
+from . import home_cache
+from .activity import record_activity
+from .counters import adjust_seller_rating, track_listing_change
+from .geo import geocode
+from .image_variants import schedule_variants
+from .models import Category, Listing, ListingImage, Review, SavedListing
+from .search import get_backend
+
+
+def listing_state(listing):
+    """The fields whose changes the handlers below react to."""
+    return {
+        'category_id': listing.category_id,
+        'is_active': listing.is_active,
+        'is_sold': listing.is_sold,
+        'is_featured': listing.is_featured,
+        'is_boosted': listing.is_boosted,
+        'boosted_until': listing.boosted_until,
+        'title': listing.title,
+        'price': listing.price,
+        'negotiable': listing.negotiable,
+        'condition': listing.condition,
+        'location': listing.location,
+    }
+
+
+@receiver(pre_save, sender=Listing)
+def geocode_listing(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'location' not in update_fields):
+        return
+    loaded = getattr(instance, '_loaded_values', None)
+    if instance._state.adding or not loaded or loaded.get('location') != instance.location:
+        geocode(instance)
+
+
+@receiver(post_save, sender=Listing)
+def listing_saved(sender, instance, created, **kwargs):
+    old_values = None if created else getattr(instance, '_loaded_values', None)
+    new_values = listing_state(instance)
+
+    get_backend().index_listing(instance)
+
+    sections = home_cache.sections_for_listing_change(old_values, new_values)
+    if track_listing_change(old_values, new_values):
+        sections.append(home_cache.CATEGORIES)
+    home_cache.bump_sections(*sections)
+    record_listing_change(old_values, new_values, created=created)
+
+    # Later saves of the same instance compare against what was just written
+    instance._loaded_values = {**(old_values or {}), **new_values}
+
+
+@receiver(pre_delete, sender=Listing)
+def listing_deleting(sender, instance, **kwargs):
+    # Its SimilarListing rows are deleted with it, the listings that showed
+    # it get new neighbours on the next build_similar_listings run
+    Listing.objects.filter(similar_links__similar=instance).update(similar_computed_at=None)
+
+
+@receiver(post_delete, sender=Listing)
+def listing_deleted(sender, instance, **kwargs):
+    old_values = getattr(instance, '_loaded_values', None) or listing_state(instance)
+
+    get_backend().remove_listing(instance.id)
+
+    sections = home_cache.sections_for_listing_change(old_values, None)
+    if track_listing_change(old_values, None):
+        sections.append(home_cache.CATEGORIES)
+    home_cache.bump_sections(*sections)
+    record_listing_change(old_values, None)
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+    if not created:
+        get_backend().reindex_category(instance.id)
+    # Category names and icons show up on every listing card as well
+    home_cache.bump_sections(*home_cache.HOME_SECTIONS)
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    home_cache.bump_sections(*home_cache.HOME_SECTIONS)
+
+
+@receiver(post_save, sender=ListingImage)
+def listing_image_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        schedule_variants(instance.pk)
+    home_cache.bump_sections(home_cache.FEATURED, home_cache.RECENT, home_cache.BOOSTED)
+
+
+@receiver(post_delete, sender=ListingImage)
+def listing_image_deleted(sender, instance, **kwargs):
+    # on_delete=SET_NULL has already cleared Listing.primary_image if it
+    # pointed at this image
+    ListingImage.promote_next(instance.listing_id)
+    home_cache.bump_sections(home_cache.FEATURED, home_cache.RECENT, home_cache.BOOSTED)
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, **kwargs):
+    old_values = None if created else getattr(instance, '_loaded_values', None)
+    if old_values:
+        if (old_values['seller_id'], old_values['rating']) == (instance.seller_id, instance.rating):
+            return
+        adjust_seller_rating(old_values['seller_id'], old_values['rating'], -1)
+    adjust_seller_rating(instance.seller_id, instance.rating, 1)
+    instance._loaded_values = {'seller_id': instance.seller_id, 'rating': instance.rating}
+    # Seller ratings are shown on the home page cards
+    home_cache.bump_sections(home_cache.FEATURED, home_cache.RECENT, home_cache.BOOSTED)
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    old_values = getattr(instance, '_loaded_values', None) or {
+        'seller_id': instance.seller_id, 'rating': instance.rating,
+    }
+    adjust_seller_rating(old_values['seller_id'], old_values['rating'], -1)
+    home_cache.bump_sections(home_cache.FEATURED, home_cache.RECENT, home_cache.BOOSTED)
+
+
+@receiver(post_save, sender=SavedListing)
+def listing_saved_by_user(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        record_activity(instance.listing_id, 'saves')
+
+
+@receiver(post_delete, sender=SavedListing)
+def listing_unsaved_by_user(sender, instance, **kwargs):
+    # Taken off the day of the save, where rollup_listing_stats() counts it
+    record_activity(instance.listing_id, 'saves', -1, timezone.localdate(instance.saved_at))
@@ -0,0 +1,229 @@
+"""
+Offline similar-listing index.
+
+Listings are turned into sparse, L2-normalized TF-IDF vectors over their
+title (weighted double) and description. Candidates come from an inverted
+index, so only listings sharing at least one term are scored. The final
+score blends text cosine similarity with category match and price
+proximity, and the top neighbours of each listing are stored in
+SimilarListing for listing_detail to read.
+
+The score is symmetric, so an incremental run over new and edited listings
+also recomputes every listing the changed ones now rank high enough for.
+Listings that point at a changed, sold, deactivated or deleted listing are
+recomputed too (deleted ones through the pre_delete handler in
+listings/signals.py), so their lists never shrink silently.
+Listing.similar_computed_at records each run, so listings without any
+neighbours are not picked up again until they change.
+"""
+import bisect
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from .models import Listing, SimilarListing
+
+TOP_N = 8
+
+TEXT_WEIGHT = 0.7
+CATEGORY_WEIGHT = 0.2
+PRICE_WEIGHT = 0.1
+
+# Terms found in more than this share of listings (once the catalogue is big
+# enough for it to matter) carry no signal and would make every listing a
+# candidate for every other one
+MAX_DOCUMENT_FREQUENCY = 0.2
+MIN_DOCUMENTS_FOR_CUTOFF = 50
+
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is',
+    'it', 'of', 'on', 'or', 'the', 'this', 'to', 'with', 'very', 'good', 'new',
+}
+
+
+def tokenize(text):
+    return [
+        token for token in re.findall(r'[a-z0-9]+', text.lower())
+        if len(token) > 1 and token not in STOP_WORDS
+    ]
+
+
+class ListingDocument:
+    def __init__(self, listing_id, category_id, price, terms):
+        self.listing_id = listing_id
+        self.category_id = category_id
+        self.price = float(price)
+        self.terms = terms
+        self.vector = {}
+
+
+def load_documents():
+    rows = Listing.objects.filter(is_active=True, is_sold=False).values_list(
+        'id', 'category_id', 'price', 'title', 'description'
+    )
+    return [
+        ListingDocument(
+            listing_id, category_id, price,
+            Counter(tokenize(title) * 2 + tokenize(description))
+        )
+        for listing_id, category_id, price, title, description in rows
+    ]
+
+
+class SimilarityIndex:
+    def __init__(self, documents):
+        self.documents = {doc.listing_id: doc for doc in documents}
+        total = len(documents) or 1
+
+        document_frequency = Counter()
+        for doc in documents:
+            document_frequency.update(doc.terms.keys())
+        max_df = max(MIN_DOCUMENTS_FOR_CUTOFF, int(total * MAX_DOCUMENT_FREQUENCY))
+        idf = {
+            term: math.log(total / df) + 1
+            for term, df in document_frequency.items()
+            if df <= max_df
+        }
+
+        # Per category, (price, listing_id) sorted by price, used to fill up
+        # neighbours for listings with little text in common with others
+        self.by_category = defaultdict(list)
+        for doc in documents:
+            if doc.category_id is not None:
+                self.by_category[doc.category_id].append((doc.price, doc.listing_id))
+        for prices in self.by_category.values():
+            prices.sort(key=lambda item: item[0])
+
+        self.postings = defaultdict(list)
+        for doc in documents:
+            vector = {
+                term: (1 + math.log(count)) * idf[term]
+                for term, count in doc.terms.items()
+                if term in idf
+            }
+            norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1
+            doc.vector = {term: weight / norm for term, weight in vector.items()}
+            for term, weight in doc.vector.items():
+                self.postings[term].append((doc.listing_id, weight))
+
+    @staticmethod
+    def price_proximity(a, b):
+        if a <= 0 or b <= 0:
+            return 1.0 if a == b else 0.0
+        # 1.0 for the same price, 0.0 once one is 10x the other
+        return max(0.0, 1 - abs(math.log10(a / b)))
+
+    def neighbours(self, listing_id, top_n=TOP_N):
+        """Return [(neighbour_id, score)] for listing_id, best first."""
+        return self.candidates(listing_id, top_n)[:top_n]
+
+    def candidates(self, listing_id, top_n=TOP_N):
+        """Every listing scored against listing_id, [(other_id, score)] best first."""
+        doc = self.documents.get(listing_id)
+        if doc is None:
+            return []
+
+        cosine = defaultdict(float)
+        for term, weight in doc.vector.items():
+            for other_id, other_weight in self.postings[term]:
+                if other_id != listing_id:
+                    cosine[other_id] += weight * other_weight
+
+        if len(cosine) < top_n and doc.category_id is not None:
+            # Not enough text matches, add the closest priced listings from
+            # the same category
+            prices = self.by_category[doc.category_id]
+            position = bisect.bisect_left(prices, doc.price, key=lambda item: item[0])
+            for _, other_id in prices[max(0, position - top_n):position + top_n + 1]:
+                if other_id != listing_id:
+                    cosine.setdefault(other_id, 0.0)
+
+        scored = []
+        for other_id, text_score in cosine.items():
+            other = self.documents[other_id]
+            score = (
+                TEXT_WEIGHT * text_score +
+                CATEGORY_WEIGHT * (doc.category_id is not None and doc.category_id == other.category_id) +
+                PRICE_WEIGHT * self.price_proximity(doc.price, other.price)
+            )
+            scored.append((other_id, score))
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored
+
+
+def stale_listing_ids():
+    """
+    Active listings never computed or edited since, and the listings pointing
+    at one of those or at a listing that is no longer shown.
+    """
+    visible = Listing.objects.filter(is_active=True, is_sold=False)
+    edited = Q(updated_at__gt=F('similar_computed_at'))
+    referrers = SimilarListing.objects.filter(
+        Q(similar__in=visible.filter(edited)) | Q(similar__is_active=False) | Q(similar__is_sold=True)
+    ).values('listing_id')
+    return list(
+        visible.filter(Q(similar_computed_at__isnull=True) | edited | Q(id__in=referrers)).values_list('id', flat=True)
+    )
+
+
+def reverse_neighbour_ids(index, listing_ids, top_n=TOP_N):
+    """
+    Listings outside listing_ids whose stored neighbours one of listing_ids
+    now outscores, or that have fewer than top_n.
+    """
+    best = {}
+    for listing_id in listing_ids:
+        for other_id, score in index.candidates(listing_id, top_n):
+            best[other_id] = max(score, best.get(other_id, score))
+    for listing_id in listing_ids:
+        best.pop(listing_id, None)
+
+    stored = {}
+    other_ids = list(best)
+    for start in range(0, len(other_ids), 1000):
+        stored.update(
+            (row['listing_id'], row)
+            for row in SimilarListing.objects.filter(listing_id__in=other_ids[start:start + 1000]).values(
+                'listing_id'
+            ).annotate(worst=Min('score'), count=Count('pk')).order_by()
+        )
+    return [
+        other_id for other_id, score in best.items()
+        if other_id not in stored or stored[other_id]['count'] < top_n or score > stored[other_id]['worst']
+    ]
+
+
+def build_similar_listings(listing_ids=None, top_n=TOP_N):
+    """
+    Recompute and store neighbours for listing_ids, or for every active
+    listing when listing_ids is None. Returns the number of listings updated.
+    """
+    index = SimilarityIndex(load_documents())
+    full = listing_ids is None
+    if full:
+        listing_ids = list(index.documents)
+    listing_ids = [listing_id for listing_id in listing_ids if listing_id in index.documents]
+    if not full:
+        listing_ids += reverse_neighbour_ids(index, listing_ids, top_n)
+
+    now = timezone.now()
+    rows = [
+        SimilarListing(listing_id=listing_id, similar_id=other_id, score=score, computed_at=now)
+        for listing_id in listing_ids
+        for other_id, score in index.neighbours(listing_id, top_n)
+    ]
+    with transaction.atomic():
+        if full:
+            SimilarListing.objects.all().delete()
+        else:
+            SimilarListing.objects.filter(
+                Q(listing_id__in=listing_ids) | Q(listing__is_active=False) | Q(listing__is_sold=True)
+            ).delete()
+        SimilarListing.objects.bulk_create(rows, batch_size=1000)
+        for start in range(0, len(listing_ids), 1000):
+            Listing.objects.filter(id__in=listing_ids[start:start + 1000]).update(similar_computed_at=now)
+    return len(listing_ids)
@@ -0,0 +1,173 @@
+"""
+Content-addressed, deduplicated media storage.
+
+Uploads to ListingImage.image and Message.image are stored under
+blobs/<sha256[:2]>/<sha256[2:4]>/<sha256>.<ext>, so the same photo uploaded
+again resolves to the file that already exists instead of a new copy. Every
+blob has a MediaBlob row whose ref_count is the number of rows pointing at it,
+kept up to date by the signal handlers connected with track_blob_field(). The
+collect_media_blobs command deletes blobs nobody references any more.
+
+Files uploaded before this storage existed keep their old names and are not
+counted or collected.
+"""
+import hashlib
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+
+BLOB_DIR = 'blobs'
+
+# (model, field name) pairs stored in blob_storage, see track_blob_field()
+tracked_fields = []
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names files after the SHA-256 of their content."""
+
+    def blob_name(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        sha256 = digest.hexdigest()
+        extension = posixpath.splitext(name)[1].lower()
+        return f'{BLOB_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}', sha256
+
+    def save(self, name, content, max_length=None):
+        from .models import MediaBlob
+
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        blob_name, sha256 = self.blob_name(name, content)
+        if not self.exists(blob_name):
+            # A concurrent upload of the same content can win the race, the
+            # loser ends up with a suffixed name which is still a valid blob
+            blob_name = super().save(blob_name, content, max_length=max_length)
+        blob, created = MediaBlob.objects.get_or_create(
+            name=blob_name, defaults={'sha256': sha256, 'size': self.size(blob_name)}
+        )
+        if not created:
+            # Keeps collect_media_blobs away from a blob that is about to
+            # gain a reference again
+            MediaBlob.objects.filter(pk=blob.pk).update(uploaded_at=timezone.now())
+        return blob_name
+
+
+blob_storage = ContentAddressedStorage()
+
+
+def get_blob_storage():
+    return blob_storage
+
+
+def add_references(names, delta=1):
+    """Adjust the ref_count of the blobs in names (other names are ignored)."""
+    from .models import MediaBlob
+
+    counts = {}
+    for name in names:
+        if name and name.startswith(BLOB_DIR + '/'):
+            counts[name] = counts.get(name, 0) + delta
+    with transaction.atomic():
+        for name, change in counts.items():
+            blobs = MediaBlob.objects.filter(name=name)
+            if change < 0:
+                blobs = blobs.filter(ref_count__gte=-change)
+            blobs.update(ref_count=F('ref_count') + change)
+
+
+def release_references(names):
+    add_references(names, delta=-1)
+
+
+def track_blob_field(model, field_name):
+    """Keep MediaBlob.ref_count in sync with model.<field_name>."""
+    tracked_fields.append((model, field_name))
+    uid = f'{model._meta.label}.{field_name}'
+
+    def remember_replaced(sender, instance, raw=False, **kwargs):
+        field_file = getattr(instance, field_name)
+        # An uncommitted file is a new upload replacing the stored one
+        if raw or instance._state.adding or not field_file or field_file._committed:
+            return
+        instance._replaced_blob = sender.objects.filter(pk=instance.pk).values_list(
+            field_name, flat=True
+        ).first()
+
+    def saved(sender, instance, created, raw=False, **kwargs):
+        if raw:
+            return
+        replaced = instance.__dict__.pop('_replaced_blob', None)
+        name = getattr(instance, field_name).name
+        if created:
+            add_references([name])
+        elif replaced is not None and replaced != name:
+            add_references([name])
+            release_references([replaced])
+
+    def deleted(sender, instance, **kwargs):
+        release_references([getattr(instance, field_name).name])
+
+    pre_save.connect(remember_replaced, sender=model, weak=False, dispatch_uid=uid)
+    post_save.connect(saved, sender=model, weak=False, dispatch_uid=uid)
+    post_delete.connect(deleted, sender=model, weak=False, dispatch_uid=uid)
+
+
+def recount_references():
+    """Recount ref_count for every blob from the tracked fields, return the fixed ones."""
+    from .models import MediaBlob
+
+    actual = {}
+    for model, field_name in tracked_fields:
+        names = model.objects.filter(
+            **{f'{field_name}__startswith': BLOB_DIR + '/'}
+        ).values_list(field_name, flat=True)
+        for name in names.iterator():
+            actual[name] = actual.get(name, 0) + 1
+
+    drifted = []
+    for blob in MediaBlob.objects.all().iterator():
+        if blob.ref_count != actual.get(blob.name, 0):
+            blob.ref_count = actual.get(blob.name, 0)
+            drifted.append(blob)
+    MediaBlob.objects.bulk_update(drifted, ['ref_count'], batch_size=1000)
+    return drifted
+
+
+def collect_orphaned_blobs(older_than, dry_run=False):
+    """
+    Delete blobs without references last uploaded before older_than, along
+    with their image variants. Returns the collected MediaBlobs.
+    """
+    from django.core.files.storage import default_storage
+
+    from .image_variants import IMAGE_VARIANT_SIZES, variant_name
+    from .models import MediaBlob
+
+    candidates = list(MediaBlob.objects.filter(ref_count=0, uploaded_at__lt=older_than))
+    if dry_run:
+        return candidates
+
+    collected = []
+    for blob in candidates:
+        # Re-check in the DELETE itself in case the blob was reused meanwhile
+        deleted, _ = MediaBlob.objects.filter(
+            pk=blob.pk, ref_count=0, uploaded_at__lt=older_than
+        ).delete()
+        if not deleted:
+            continue
+        blob_storage.delete(blob.name)
+        for size in IMAGE_VARIANT_SIZES:
+            for fmt in ('webp', 'jpeg'):
+                default_storage.delete(variant_name(blob.name, size, fmt))
+        collected.append(blob)
+    return collected
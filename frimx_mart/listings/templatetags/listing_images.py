@@ -0,0 +1,30 @@
+from django import template
+
+from ..image_variants import variant_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def image_url(listing_image, size, fmt='jpeg'):
+    """{% image_url image 'thumb' %} - URL of a named size of a ListingImage."""
+    return variant_url(listing_image, size, fmt)
+
+
+@register.inclusion_tag('listings/includes/picture.html')
+def listing_picture(listing_image, size, **attrs):
+    """
+    {% listing_picture image 'card' alt=listing.title class='...' %} renders a
+    <picture> serving WebP with a JPEG fallback, or the original image while
+    the variants are still being generated.
+    """
+    variant = (listing_image.variants or {}).get(size, {})
+    return {
+        'webp_url': variant_url(listing_image, size, 'webp') if variant.get('webp') else '',
+        'src': variant_url(listing_image, size, 'jpeg'),
+        'width': variant.get('width'),
+        'height': variant.get('height'),
+        'alt': attrs.pop('alt', ''),
+        'loading': attrs.pop('loading', 'lazy'),
+        'attrs': attrs,
+    }
@@ -0,0 +1,26 @@
+"""
+Helpers shared by the test suites of the apps.
+"""
+from decimal import Decimal
+from unittest import mock
+
+from .models import Listing
+
+
+def make_listing(seller, **fields):
+    fields.setdefault('title', 'Listing')
+    fields.setdefault('description', 'Description')
+    fields.setdefault('price', Decimal('100'))
+    fields.setdefault('location', 'Accra')
+    return Listing.objects.create(seller=seller, **fields)
+
+
+def flush_immediately(test_case, *buffers):
+    """
+    Make the BufferedCounters write every add() at once for the rest of the
+    test, so nothing is left to their flush threads.
+    """
+    for buffer in buffers:
+        patcher = mock.patch.object(buffer, 'flush_interval', 0)
+        patcher.start()
+        test_case.addCleanup(patcher.stop)
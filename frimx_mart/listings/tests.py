@@ -1,3 +1,543 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import shutil
+import tempfile
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from dashboard.models import PlatformDailyStats
+from chat.models import ChatThread, Message
+from dashboard.stats import stats_buffer
+
+from .activity import activity_counter
+from .buffers import BufferedCounter
+from .counters import reconcile_category_counts
+from .expiry import expire_promotions
+from .geo import filter_by_location
+from .models import Category, Listing, ListingDailyStats, ListingImage, MediaBlob, Promotion, SavedListing
+from .storage import blob_storage, collect_orphaned_blobs, recount_references
+from .search import get_backend, SQLiteSearchBackend
+from .pagination import CursorPaginator, decode_cursor, encode_cursor, InvalidCursor
+from .testing import flush_immediately, make_listing
+
+User = get_user_model()
+
+
+def crafted_cursor(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        # Three prices shared by several listings each, so pages break inside ties
+        cls.listings = [
+            make_listing(cls.seller, title=f'Item {i}', price=Decimal(10 * (i % 3)))
+            for i in range(11)
+        ]
+
+    def walk(self, paginator):
+        pages = [paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        return pages
+
+    def test_forward_pages_cover_every_row_once_in_order(self):
+        paginator = CursorPaginator(Listing.objects.all(), 4, 'price')
+        pages = self.walk(paginator)
+        rows = [listing for page in pages for listing in page]
+
+        self.assertEqual([len(page) for page in pages], [4, 4, 3])
+        self.assertEqual(len({listing.pk for listing in rows}), len(self.listings))
+        self.assertEqual(rows, sorted(rows, key=lambda listing: (listing.price, listing.pk)))
+
+    def test_descending_pages_break_ties_on_primary_key(self):
+        paginator = CursorPaginator(Listing.objects.all(), 4, 'price', descending=True)
+        rows = [listing for page in self.walk(paginator) for listing in page]
+
+        self.assertEqual(
+            rows, sorted(rows, key=lambda listing: (listing.price, listing.pk), reverse=True)
+        )
+
+    def test_previous_cursor_returns_the_page_before(self):
+        paginator = CursorPaginator(Listing.objects.all(), 4, 'price')
+        first, second, third = self.walk(paginator)
+
+        self.assertFalse(first.has_previous())
+        self.assertEqual(list(paginator.get_page(third.previous_cursor)), list(second))
+        self.assertEqual(list(paginator.get_page(second.previous_cursor)), list(first))
+
+    def test_cursor_round_trip(self):
+        cursor = encode_cursor(['2026-01-01T00:00:00+00:00', 'abc'], reverse=True)
+        self.assertEqual(decode_cursor(cursor), (['2026-01-01T00:00:00+00:00', 'abc'], True))
+
+    def test_malformed_cursors_are_rejected(self):
+        for payload in [{'v': {'a': 1}, 'r': False}, {'v': [1], 'r': False}, {'v': [1, 2], 'r': 'no'}, [1, 2]]:
+            with self.subTest(payload=payload), self.assertRaises(InvalidCursor):
+                decode_cursor(crafted_cursor(payload))
+        with self.assertRaises(InvalidCursor):
+            decode_cursor('not a cursor')
+
+    def test_bad_cursors_fall_back_to_the_first_page(self):
+        paginator = CursorPaginator(Listing.objects.all(), 4, 'price')
+        first = list(paginator.get_page())
+        for cursor in [
+            'garbage',
+            crafted_cursor({'v': {'a': 1}, 'r': False}),
+            crafted_cursor({'v': ['not a price', 'not a uuid'], 'r': False}),
+            crafted_cursor({'v': [[1], {'x': 2}], 'r': True}),
+        ]:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(list(paginator.get_page(cursor)), first)
+
+    def test_listing_list_survives_crafted_cursors(self):
+        cursor = crafted_cursor({'v': {'a': 1}, 'r': False})
+        for query in ['', '&search=item', '&sort=price_asc']:
+            with self.subTest(query=query):
+                response = self.client.get(f'/listings/?cursor={cursor}{query}')
+                self.assertEqual(response.status_code, 200)
+
+
+class CategoryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        cls.phones = Category.objects.create(name='Phones')
+        cls.laptops = Category.objects.create(name='Laptops')
+
+    def counts(self):
+        return {
+            category.name: category.active_listing_count
+            for category in Category.objects.filter(id__in=[self.phones.id, self.laptops.id])
+        }
+
+    def test_created_listings_count_towards_their_category(self):
+        make_listing(self.seller, category=self.phones)
+        make_listing(self.seller, category=self.phones)
+        make_listing(self.seller, category=self.laptops, is_active=False)
+
+        self.assertEqual(self.counts(), {'Phones': 2, 'Laptops': 0})
+
+    def test_sold_and_deactivated_listings_stop_counting(self):
+        sold = make_listing(self.seller, category=self.phones)
+        hidden = make_listing(self.seller, category=self.phones)
+
+        sold.is_sold = True
+        sold.save()
+        hidden.is_active = False
+        hidden.save()
+        self.assertEqual(self.counts()['Phones'], 0)
+
+        hidden.is_active = True
+        hidden.save()
+        self.assertEqual(self.counts()['Phones'], 1)
+
+    def test_moving_a_listing_moves_its_count(self):
+        listing = make_listing(self.seller, category=self.phones)
+
+        listing.category = self.laptops
+        listing.save()
+        self.assertEqual(self.counts(), {'Phones': 0, 'Laptops': 1})
+
+        Listing.objects.get(pk=listing.pk).save()
+        self.assertEqual(self.counts(), {'Phones': 0, 'Laptops': 1})
+
+    def test_deleting_a_listing_removes_its_count(self):
+        listing = make_listing(self.seller, category=self.phones)
+        Listing.objects.get(pk=listing.pk).delete()
+
+        self.assertEqual(self.counts()['Phones'], 0)
+
+    def test_reconcile_repairs_drift_from_queryset_updates(self):
+        make_listing(self.seller, category=self.phones)
+        make_listing(self.seller, category=self.phones)
+        Listing.objects.filter(category=self.phones).update(category=self.laptops)
+
+        drifted = reconcile_category_counts()
+        self.assertEqual({category.name for category in drifted}, {'Phones', 'Laptops'})
+        self.assertEqual(self.counts(), {'Phones': 0, 'Laptops': 2})
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        # More sold matches than the old search looked at before filtering
+        Listing.objects.bulk_create([
+            Listing(seller=cls.seller, title=f'Camera {i}', description='Sold camera', price=Decimal('50'),
+                    location='Accra', is_sold=True)
+            for i in range(1100)
+        ])
+        cls.title_match = make_listing(cls.seller, title='Camera camera lens', price=Decimal('300'))
+        cls.description_match = make_listing(cls.seller, title='Tripod', description='Fits any camera')
+        cls.cheap_match = make_listing(cls.seller, title='Old camera', price=Decimal('20'))
+        make_listing(cls.seller, title='Phone', description='Unrelated')
+        get_backend().rebuild()
+
+    def results(self, query=''):
+        response = self.client.get(f'/listings/?search=camera{query}')
+        return [listing.id for listing in response.context['page_obj']]
+
+    def test_visible_matches_are_found_past_the_sold_ones(self):
+        self.assertEqual(
+            set(self.results()), {self.title_match.id, self.description_match.id, self.cheap_match.id}
+        )
+
+    def test_best_matches_come_first(self):
+        results = self.results()
+        self.assertEqual(results[0], self.title_match.id)
+        self.assertEqual(results[-1], self.description_match.id)
+
+    def test_other_filters_apply_to_the_matches(self):
+        self.assertEqual(self.results('&max_price=50'), [self.cheap_match.id])
+        self.assertEqual(self.results('&sort=price_asc')[0], self.cheap_match.id)
+
+    def test_cursor_pages_cover_every_match(self):
+        Listing.objects.filter(is_sold=True).update(is_sold=False)
+        response = self.client.get('/listings/?search=camera&cursor=')
+        seen = []
+        while True:
+            page = response.context['page_obj']
+            seen.extend(listing.id for listing in page)
+            if not page.has_next():
+                break
+            response = self.client.get(f'/listings/?search=camera&cursor={page.next_cursor}')
+
+        self.assertEqual(len(seen), 1103)
+        self.assertEqual(len(set(seen)), 1103)
+
+    def test_fts_table_lookup_is_cached(self):
+        get_backend()
+        with self.assertNumQueries(0):
+            self.assertIsInstance(get_backend(), SQLiteSearchBackend)
+
+class PriceFacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        # On, just below and just above the bucket boundaries
+        for price in ['0', '49.99', '50', '199.99', '200', '200.01', '5000']:
+            make_listing(cls.seller, price=Decimal(price))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_bucket_links_show_what_the_bucket_counted(self):
+        buckets = self.client.get('/listings/').context['price_buckets']
+        self.assertEqual([bucket['count'] for bucket in buckets], [2, 2, 2, 0, 1])
+
+        for bucket in buckets:
+            query = f"?min_price={bucket['min']}"
+            if bucket['max'] is not None:
+                query += f"&max_price={bucket['max']}"
+            with self.subTest(bucket=bucket['label']):
+                response = self.client.get(f'/listings/{query}')
+                self.assertEqual(response.context['page_obj'].paginator.count, bucket['count'])
+
+class LocationFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        cls.listings = {
+            location: make_listing(seller, location=location)
+            for location in ['Makola, Accra', 'East Legon', 'Madina', 'Tema', 'Kumasi', 'Unknown Village']
+        }
+
+    def matches(self, text, radius_km=None):
+        return {
+            listing.location
+            for listing in filter_by_location(Listing.objects.all(), text, radius_km)
+        }
+
+    def test_listings_are_geocoded_from_their_location(self):
+        listing = Listing.objects.get(pk=self.listings['East Legon'].pk)
+        self.assertEqual((listing.place, listing.region), ('east_legon', 'greater_accra'))
+        self.assertEqual(Listing.objects.get(pk=self.listings['Unknown Village'].pk).place, '')
+
+    def test_a_town_includes_the_places_within_it(self):
+        for text in ['Accra', 'accra', ' ACCRA ']:
+            with self.subTest(text=text):
+                self.assertEqual(self.matches(text), {'Makola, Accra', 'East Legon', 'Madina'})
+
+    def test_a_place_within_a_town_only_matches_itself(self):
+        self.assertEqual(self.matches('legon'), {'East Legon'})
+
+    def test_regions_and_unknown_text(self):
+        self.assertEqual(
+            self.matches('Greater Accra'), {'Makola, Accra', 'East Legon', 'Madina', 'Tema'}
+        )
+        self.assertEqual(self.matches('village'), {'Unknown Village'})
+
+    def test_radius_search_uses_distance(self):
+        self.assertEqual(self.matches('Accra', radius_km=25), {'Makola, Accra', 'East Legon', 'Madina', 'Tema'})
+        self.assertNotIn('Kumasi', self.matches('Accra', radius_km=100))
+
+class PromotionExpiryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+
+    def setUp(self):
+        self.now = timezone.now()
+        flush_immediately(self, stats_buffer)
+
+    def promote(self, listing, ends_in, promotion_type='featured'):
+        return Promotion.objects.create(
+            listing=listing, promotion_type=promotion_type, cost=Decimal('10'),
+            start_date=self.now - timedelta(days=7), end_date=self.now + ends_in,
+        )
+
+    def expire(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return expire_promotions(self.now)
+
+    def test_boosts_expire_once_their_period_ends(self):
+        # Created with their signals' stats recorded, so the totals start out right
+        with self.captureOnCommitCallbacks(execute=True):
+            make_listing(self.seller, is_boosted=True, boosted_until=self.now - timedelta(hours=1))
+            make_listing(self.seller, is_boosted=True)
+            running = make_listing(self.seller, is_boosted=True, boosted_until=self.now + timedelta(hours=1))
+        stats = PlatformDailyStats.objects.get(date=timezone.localdate())
+        self.assertEqual(stats.boosted_listings, 3)
+
+        expired = self.expire()
+
+        self.assertEqual(expired['boosts'], 2)
+        self.assertEqual(
+            set(Listing.objects.filter(is_boosted=True).values_list('id', flat=True)), {running.id}
+        )
+        stats.refresh_from_db()
+        self.assertEqual((stats.boosted_listings, stats.active_listings), (1, 3))
+
+    def test_featured_listings_are_unfeatured_when_their_last_promotion_ends(self):
+        ended = make_listing(self.seller, is_featured=True)
+        renewed = make_listing(self.seller, is_featured=True)
+        manual = make_listing(self.seller, is_featured=True)
+        self.promote(ended, -timedelta(hours=1))
+        self.promote(renewed, -timedelta(hours=1))
+        self.promote(renewed, timedelta(days=1))
+        # An urgent promotion ending does not touch the featured flag
+        self.promote(manual, -timedelta(hours=1), promotion_type='urgent')
+
+        expired = self.expire()
+
+        self.assertEqual((expired['promotions'], expired['features']), (3, 1))
+        self.assertEqual(
+            set(Listing.objects.filter(is_featured=True).values_list('id', flat=True)),
+            {renewed.id, manual.id},
+        )
+        self.assertEqual(Promotion.objects.filter(is_active=True).count(), 1)
+
+    def test_a_second_sweep_has_nothing_left_to_expire(self):
+        make_listing(self.seller, is_boosted=True, boosted_until=self.now - timedelta(days=1))
+        self.promote(make_listing(self.seller, is_featured=True), -timedelta(days=1))
+
+        self.expire()
+
+        self.assertEqual(sum(self.expire().values()), 0)
+
+
+class ListingActivityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+        cls.listing = make_listing(cls.seller)
+
+    def setUp(self):
+        flush_immediately(self, activity_counter)
+
+    def view(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.get(f'/listings/{self.listing.id}/').status_code, 200)
+
+    def daily(self, day=None):
+        return ListingDailyStats.objects.filter(listing=self.listing, date=day or timezone.localdate())
+
+    def test_views_reach_the_listing_and_its_daily_row_once(self):
+        self.view()
+        self.view()
+
+        self.assertEqual(Listing.objects.get(pk=self.listing.pk).views, 2)
+        self.assertEqual(self.daily().get().views, 2)
+
+    def test_repeat_views_are_not_counted(self):
+        with mock.patch('listings.view_counter.DEDUP_SECONDS', 60):
+            self.view()
+            self.view()
+
+        self.assertEqual(Listing.objects.get(pk=self.listing.pk).views, 1)
+        self.assertEqual(self.daily().get().views, 1)
+
+    def test_saving_a_stale_listing_keeps_the_counters(self):
+        stale = Listing.objects.get(pk=self.listing.pk)
+        self.view()
+        self.client.force_login(self.buyer)
+        self.client.post(f'/listings/{self.listing.id}/save/')
+
+        stale.title = 'Renamed'
+        stale.save()
+
+        listing = Listing.objects.get(pk=self.listing.pk)
+        self.assertEqual((listing.title, listing.views, listing.saves), ('Renamed', 1, 1))
+
+    def test_save_toggle_counts_saves(self):
+        for user in [self.buyer, self.seller]:
+            self.client.force_login(user)
+            self.client.post(f'/listings/{self.listing.id}/save/')
+        self.assertEqual(Listing.objects.get(pk=self.listing.pk).saves, 2)
+
+        self.client.post(f'/listings/{self.listing.id}/save/')
+        self.assertEqual(Listing.objects.get(pk=self.listing.pk).saves, 1)
+
+    def test_unsaving_an_old_save_never_goes_below_zero(self):
+        old_day = timezone.localdate() - timedelta(days=90)
+        with self.captureOnCommitCallbacks(execute=True):
+            saved = SavedListing.objects.create(user=self.buyer, listing=self.listing)
+            other = SavedListing.objects.create(user=self.seller, listing=self.listing)
+        # Saved before the daily rows existed, and on a day already counted as 0
+        SavedListing.objects.filter(pk=saved.pk).update(saved_at=timezone.now() - timedelta(days=90))
+        yesterday = timezone.localdate() - timedelta(days=1)
+        ListingDailyStats.objects.create(listing=self.listing, seller=self.seller, date=yesterday)
+        SavedListing.objects.filter(pk=other.pk).update(saved_at=timezone.now() - timedelta(days=1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SavedListing.objects.get(pk=saved.pk).delete()
+            SavedListing.objects.get(pk=other.pk).delete()
+        self.view()
+
+        self.assertFalse(self.daily(old_day).exists())
+        self.assertEqual(self.daily(yesterday).get().saves, 0)
+        self.assertEqual(Listing.objects.get(pk=self.listing.pk).views, 1)
+        self.assertEqual(self.daily().get().views, 1)
+
+
+class RecordingCounter(BufferedCounter):
+    """Keeps what it writes, and rejects the key 'bad'."""
+    name = 'test counter'
+
+    def __init__(self):
+        super().__init__(flush_interval=3600)
+        self.written = []
+
+    def write(self, pending):
+        if 'bad' in pending:
+            raise ValueError('rejected')
+        self.written.append(dict(pending))
+
+
+@mock.patch.object(RecordingCounter, '_start_thread')
+class BufferedCounterTests(TestCase):
+    def test_a_rejected_key_does_not_hold_back_the_others(self, start_thread):
+        counter = RecordingCounter()
+        for key in ['good', 'bad', 'also good']:
+            counter.add(key)
+
+        with self.assertLogs('listings.buffers', 'ERROR'):
+            self.assertEqual(counter.flush(), 2)
+        self.assertEqual(counter.written, [{'good': 1}, {'also good': 1}])
+        # The rejected key was dropped rather than retried forever
+        self.assertEqual(counter.flush(), 0)
+
+    def test_deltas_are_kept_when_nothing_can_be_written(self, start_thread):
+        counter = RecordingCounter()
+        counter.add('bad', 2)
+
+        with self.assertLogs('listings.buffers', 'ERROR'):
+            self.assertEqual(counter.flush(), 0)
+        with mock.patch.object(RecordingCounter, 'write') as write:
+            self.assertEqual(counter.flush(), 1)
+        write.assert_called_once_with(Counter({'bad': 2}))
+
+
+def image_upload(color, name='photo.png'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (4, 4), color).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class MediaBlobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password')
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+        cls.listing = make_listing(cls.seller)
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def add_image(self, color, name='photo.png'):
+        return ListingImage.objects.create(listing=self.listing, image=image_upload(color, name))
+
+    def ref_counts(self):
+        return dict(MediaBlob.objects.values_list('name', 'ref_count'))
+
+    def test_identical_uploads_share_one_counted_blob(self):
+        first = self.add_image('red', 'a.png')
+        second = self.add_image('red', 'b.PNG')
+        thread = ChatThread.objects.create(listing=self.listing, buyer=self.buyer, seller=self.seller)
+        Message.objects.create(thread=thread, sender=self.buyer, image=image_upload('red'))
+        self.add_image('blue')
+
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(blob_storage.exists(first.image.name))
+        self.assertEqual(sorted(self.ref_counts().values()), [1, 3])
+
+    def test_replacing_and_deleting_release_references(self):
+        image = self.add_image('red')
+        red = image.image.name
+        self.add_image('red')
+
+        image.image = image_upload('green')
+        image.save()
+        self.assertEqual(self.ref_counts(), {red: 1, image.image.name: 1})
+
+        ListingImage.objects.filter(image=red).get().delete()
+        self.assertEqual(self.ref_counts()[red], 0)
+
+    def test_collection_deletes_only_old_unreferenced_blobs(self):
+        kept = self.add_image('red').image.name
+        orphan = self.add_image('blue')
+        recent = self.add_image('green')
+        orphan.delete()
+        recent.delete()
+        MediaBlob.objects.exclude(name=recent.image.name).update(
+            uploaded_at=timezone.now() - timedelta(days=2)
+        )
+
+        dry_run = collect_orphaned_blobs(timezone.now() - timedelta(days=1), dry_run=True)
+        self.assertEqual([blob.name for blob in dry_run], [orphan.image.name])
+        self.assertTrue(blob_storage.exists(orphan.image.name))
+
+        collected = collect_orphaned_blobs(timezone.now() - timedelta(days=1))
+
+        self.assertEqual([blob.name for blob in collected], [orphan.image.name])
+        self.assertFalse(blob_storage.exists(orphan.image.name))
+        self.assertTrue(blob_storage.exists(kept))
+        self.assertTrue(blob_storage.exists(recent.image.name))
+        self.assertEqual(set(self.ref_counts()), {kept, recent.image.name})
+
+    def test_recount_repairs_drifted_counts(self):
+        name = self.add_image('red').image.name
+        self.add_image('red')
+        MediaBlob.objects.update(ref_count=0)
+
+        drifted = recount_references()
+
+        self.assertEqual([blob.name for blob in drifted], [name])
+        self.assertEqual(self.ref_counts(), {name: 2})
@@ -0,0 +1,35 @@
+"""
+Buffered view counting for listing_detail.
+
+Views are added to the buffer of listings/activity.py, whose flush writes
+them to the per-day stats and to Listing.views together, as aggregated
+deltas with queryset.update(views=F('views') + n).
+
+Repeat views from the same session can be ignored for
+LISTING_VIEW_DEDUP_SECONDS (0 disables de-duplication).
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .activity import count_activity
+
+DEDUP_SECONDS = getattr(settings, 'LISTING_VIEW_DEDUP_SECONDS', 0)
+
+
+def _is_repeat_view(request, listing_id):
+    if not DEDUP_SECONDS:
+        return False
+    session_key = request.session.session_key
+    if not session_key:
+        # No session yet, fall back to the client address
+        session_key = request.META.get('REMOTE_ADDR', '')
+    # cache.add() only succeeds for the first view inside the window
+    return not cache.add(f'listing_viewed:{listing_id}:{session_key}', 1, DEDUP_SECONDS)
+
+
+def record_view(request, listing):
+    """Count a view of listing, return False if it was a de-duplicated repeat."""
+    if _is_repeat_view(request, listing.id):
+        return False
+    count_activity(listing.id, 'views')
+    return True
@@ -2,53 +2,64 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user_model
 from django.contrib import messages
-from django.db.models import Q, Count
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
-from django.utils import timezone
-from .models import Listing, Category, SavedListing, ListingImage, Review, CONDITION_CHOICES
+from django.db.models import F
+from .models import Listing, Category, SavedListing, Review, CONDITION_CHOICES
 from .forms import ListingForm, ListingImageForm, ReviewForm
+from .search import search_listings
+from .pagination import CursorPaginator, LISTING_ORDERINGS
+from .facets import compute_facets
+from . import home_cache
+from .view_counter import record_view
+from .geo import filter_by_location, RADIUS_CHOICES
+from .image_ingest import ingest_listing_images, validate_listing_images
 from chat.models import ChatThread
 
 User = get_user_model()
 
 def home(request):
+    # The querysets below are lazy, they only run when the matching cached
+    # fragment in home.html has expired or been invalidated
+    
     # Get featured listings
     featured_listings = Listing.objects.filter(
         is_active=True, 
         is_sold=False,
         is_featured=True
-    ).order_by('-created_at')[:8]
+    ).select_related('category', 'seller', 'primary_image').order_by('-created_at')[:8]
     
     # Get recent listings
     recent_listings = Listing.objects.filter(
         is_active=True, 
         is_sold=False
-    ).order_by('-created_at')[:12]
+    ).select_related('category', 'seller', 'primary_image').order_by('-created_at')[:12]
     
-    # Get boosted listings
+    # Get boosted listings, expired boosts are cleared by listings/expiry.py
     boosted_listings = Listing.objects.filter(
         is_active=True,
         is_sold=False,
-        is_boosted=True,
-        boosted_until__gt=timezone.now()
-    ).order_by('-boosted_until')[:6]
+        is_boosted=True
+    ).select_related('category', 'seller', 'primary_image').order_by('-boosted_until')[:6]
     
     # Get categories with most listings
-    # Note: We use total_count for ordering, but template will use the property listing_count
-    popular_categories = Category.objects.annotate(
-        total_count=Count('listing')
-    ).order_by('-total_count')[:8]
+    popular_categories = Category.objects.order_by('-active_listing_count')[:8]
     
     context = {
         'featured_listings': featured_listings,
         'recent_listings': recent_listings,
         'boosted_listings': boosted_listings,
         'popular_categories': popular_categories,
+        'home_versions': home_cache.get_section_versions(),
+        'home_cache_timeout': home_cache.HOME_CACHE_TIMEOUT,
     }
     return render(request, 'listings/home.html', context)
 
 def listing_list(request):
-    listings = Listing.objects.filter(is_active=True, is_sold=False)
+    listings = Listing.objects.filter(is_active=True, is_sold=False).select_related(
+        'category', 'seller', 'primary_image'
+    )
     
     # Filters
     category = request.GET.get('category')
@@ -56,63 +67,91 @@ def listing_list(request):
     min_price = request.GET.get('min_price')
     max_price = request.GET.get('max_price')
     location = request.GET.get('location')
+    radius = request.GET.get('radius')
     search = request.GET.get('search')
     sort = request.GET.get('sort', '-created_at')
+    filters = {
+        'category': category,
+        'condition': condition,
+        'min_price': min_price,
+        'max_price': max_price,
+        'location': location,
+        'radius': radius,
+        'search': search,
+        'sort': sort,
+    }
     
-    if category:
-        listings = listings.filter(category__name=category)
-    if condition:
-        listings = listings.filter(condition=condition)
     if min_price:
         listings = listings.filter(price__gte=min_price)
     if max_price:
         listings = listings.filter(price__lte=max_price)
     if location:
-        listings = listings.filter(location__icontains=location)
+        radius_km = int(radius) if radius and radius.isdigit() else None
+        listings = filter_by_location(listings, location, radius_km)
+    search_rank = None
     if search:
-        listings = listings.filter(
-            Q(title__icontains=search) | 
-            Q(description__icontains=search) |
-            Q(category__name__icontains=search)
-        )
+        listings, search_rank = search_listings(listings, search)
+    
+    # Sidebar counts come from the listings before category and condition
+    # are applied, in a single grouped (and cached) query
+    categories = list(Category.objects.all())
+    category_ids = {cat.id for cat in categories if cat.name == category}
+    facets = compute_facets(listings, filters, category_ids)
+    for cat in categories:
+        cat.facet_count = facets.categories.get(cat.id, 0)
+    
+    if category:
+        listings = listings.filter(category_id__in=category_ids)
+    if condition:
+        listings = listings.filter(condition=condition)
     
     # Sorting
-    if sort == 'price_asc':
-        listings = listings.order_by('price')
-    elif sort == 'price_desc':
-        listings = listings.order_by('-price')
-    elif sort == 'recent':
-        listings = listings.order_by('-created_at')
-    elif sort == 'popular':
-        listings = listings.order_by('-views')
+    if search_rank is not None and 'sort' not in request.GET:
+        # Best matches first when the user has not picked a sort order
+        listings = listings.annotate(search_rank=search_rank)
+        sort_field, descending = 'search_rank', True
+    else:
+        sort_field, descending = LISTING_ORDERINGS.get(sort, LISTING_ORDERINGS['-created_at'])
     
     # Pagination
-    paginator = Paginator(listings, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    cursor = request.GET.get('cursor')
+    if cursor is not None or settings.LISTING_CURSOR_PAGINATION:
+        # Keyset pagination: no COUNT(*) and no OFFSET, deep pages stay cheap
+        paginator = CursorPaginator(listings, 20, sort_field, descending)
+        page_obj = paginator.get_page(cursor)
+    else:
+        ordering = [f"{'-' if descending else ''}{sort_field}"]
+        if sort_field == 'search_rank':
+            ordering.append('-created_at')
+        paginator = Paginator(listings.order_by(*ordering), 20)
+        page_number = request.GET.get('page')
+        page_obj = paginator.get_page(page_number)
     
     context = {
         'page_obj': page_obj,
-        'categories': Category.objects.all(),
-        'conditions': CONDITION_CHOICES,
-        'filters': {
-            'category': category,
-            'condition': condition,
-            'min_price': min_price,
-            'max_price': max_price,
-            'location': location,
-            'search': search,
-            'sort': sort,
-        }
+        'cursor_pagination': isinstance(paginator, CursorPaginator),
+        'categories': categories,
+        'conditions': [
+            (value, label, facets.conditions.get(value, 0))
+            for value, label in CONDITION_CHOICES
+        ],
+        'price_buckets': facets.price_buckets,
+        'radius_choices': RADIUS_CHOICES,
+        'filters': filters,
     }
     return render(request, 'listings/listing_list.html', context)
 
 def listing_detail(request, listing_id):
-    listing = get_object_or_404(Listing, id=listing_id, is_active=True)
+    listing = get_object_or_404(
+        Listing.objects.select_related('category', 'seller', 'primary_image'),
+        id=listing_id,
+        is_active=True
+    )
+    gallery_images = [image for image in listing.images.all() if image.id != listing.primary_image_id]
     
-    # Increment view count
-    listing.views += 1
-    listing.save()
+    # Count the view in the in-process buffer, it is flushed in bulk later
+    if record_view(request, listing):
+        listing.views += 1
     
     # Check if user has saved this listing
     is_saved = False
@@ -129,12 +168,19 @@ def listing_detail(request, listing_id):
             seller=listing.seller
         ).first()
     
-    # Get similar listings
-    similar_listings = Listing.objects.filter(
-        category=listing.category,
+    # Get similar listings, precomputed by the build_similar_listings command
+    similar_listings = list(Listing.objects.filter(
+        similar_to_links__listing=listing,
         is_active=True,
         is_sold=False
-    ).exclude(id=listing.id).order_by('?')[:4]
+    ).select_related('primary_image').order_by('-similar_to_links__score')[:4])
+    if not similar_listings:
+        # Not indexed yet, fall back to the newest listings in the category
+        similar_listings = Listing.objects.filter(
+            category=listing.category,
+            is_active=True,
+            is_sold=False
+        ).exclude(id=listing.id).select_related('primary_image').order_by('-created_at')[:4]
     
     # Get seller's other listings
     seller_listings = Listing.objects.filter(
@@ -148,6 +194,7 @@ def listing_detail(request, listing_id):
     
     context = {
         'listing': listing,
+        'gallery_images': gallery_images,
         'is_saved': is_saved,
         'similar_listings': similar_listings,
         'seller_listings': seller_listings,
@@ -160,19 +207,19 @@ def listing_detail(request, listing_id):
 def create_listing(request):
     if request.method == 'POST':
         form = ListingForm(request.POST)
+        images = request.FILES.getlist('images')
+        if form.is_valid():
+            try:
+                validate_listing_images(images)
+            except ValidationError as e:
+                form.add_error(None, e)
         if form.is_valid():
             listing = form.save(commit=False)
             listing.seller = request.user
             listing.save()
             
-            # Handle image uploads
-            images = request.FILES.getlist('images')
-            for i, image in enumerate(images[:8]):  # Limit to 8 images
-                ListingImage.objects.create(
-                    listing=listing,
-                    image=image,
-                    is_primary=(i == 0)
-                )
+            # The first image is the primary one
+            ingest_listing_images(listing, images, primary_index=0)
             
             messages.success(request, 'Listing created successfully!')
             return redirect('listing_detail', listing_id=listing.id)
@@ -228,14 +275,13 @@ def save_listing(request, listing_id):
             listing=listing
         )
         
+        listings = Listing.objects.filter(pk=listing.pk)
         if created:
-            listing.saves += 1
-            listing.save()
+            listings.update(saves=F('saves') + 1)
             messages.success(request, 'Listing saved to your favorites!')
         else:
             saved_listing.delete()
-            listing.saves -= 1
-            listing.save()
+            listings.update(saves=F('saves') - 1)
             messages.success(request, 'Listing removed from favorites.')
     
     return redirect('listing_detail', listing_id=listing_id)